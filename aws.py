@@ -0,0 +1,181 @@
+from typing import Dict, Literal
+import threading
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ClientPool:
+    """
+    Process-wide boto3 DynamoDB client, shared by DBDynamo instances and threads
+
+    Only the low-level client, which is thread-safe and holds the HTTP
+    connection pool, is shared: every table handed out uses its
+    max_pool_connections connections. boto3 resources are not thread-safe, so
+    each thread gets its own resource & tables over that client. The session
+    and client are created on first use, under a lock since boto3 sessions
+    are not thread-safe either.
+    """
+
+    def __init__(
+        self,
+        max_pool_connections: int = 50,
+        connect_timeout: float = 5,
+        read_timeout: float = 10,
+        retry_mode: Literal["legacy", "standard", "adaptive"] = "standard",
+        max_attempts: int = 5,
+        tcp_keepalive: bool = False,
+        region_name: str = None,
+    ):
+        self.max_pool_connections = max_pool_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry_mode = retry_mode
+        self.max_attempts = max_attempts
+        self.tcp_keepalive = tcp_keepalive
+        self.region_name = region_name
+
+        self.in_flight = 0  # requests currently holding a connection
+        self.peak_in_flight = 0
+        self.requests = 0  # attempts sent, retries included
+        self.saturated = 0  # attempts sent while every pooled connection was busy
+        self.errors = 0  # attempts failing with an exception or an error status
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._client = None
+        self._local = threading.local()  # per thread DynamoDB resource
+
+    def config(self):
+        from botocore.config import Config
+
+        settings = {
+            "max_pool_connections": self.max_pool_connections,
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "retries": {"mode": self.retry_mode, "max_attempts": self.max_attempts},
+        }
+        if self.tcp_keepalive:
+            # only passed when enabled, older botocore releases don't know it
+            settings["tcp_keepalive"] = True
+
+        return Config(**settings)
+
+    def client(self):
+        """
+        Returns the shared DynamoDB client
+        """
+        with self._lock:
+            return self._get_client()
+
+    def resource(self):
+        """
+        Returns the calling thread's DynamoDB service resource, over the shared client
+        """
+        resource = getattr(self._local, "resource", None)
+        if resource is None:
+            with self._lock:
+                client = self._get_client()
+                resource = self._session.resource("dynamodb", config=self.config())
+                # tables made from here on send their requests through the shared client
+                resource.meta.client = client
+
+            self._local.resource = resource
+
+        return resource
+
+    def table(self, table_name: str) -> "ThreadLocalTable":
+        return ThreadLocalTable(self, table_name)
+
+    def _get_client(self):
+        # caller holds the lock
+        if self._client is None:
+            # boto3 is slow to import, only pay for it once the pool is used
+            import boto3
+
+            self._session = boto3.session.Session(region_name=self.region_name)
+            self._client = self._session.client("dynamodb", config=self.config())
+
+            events = self._client.meta.events
+            events.register("before-send.dynamodb", self._on_send)
+            events.register("needs-retry.dynamodb", self._on_response)
+
+        return self._client
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "max_pool_connections": self.max_pool_connections,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "utilization": self.in_flight / self.max_pool_connections,
+                "requests": self.requests,
+                "saturated": self.saturated,
+                "errors": self.errors,
+            }
+
+    def _on_send(self, **kwargs):
+        with self._lock:
+            if self.in_flight >= self.max_pool_connections:
+                self.saturated += 1
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _on_response(self, response=None, caught_exception=None, **kwargs):
+        # emitted once per attempt, whether it succeeded or not
+        failed = caught_exception is not None or (
+            response is not None and response[0].status_code >= 400
+        )
+        with self._lock:
+            self.in_flight -= 1
+            self.errors += failed
+
+
+class ThreadLocalTable:
+    """
+    DynamoDB Table handle safe to share between threads
+
+    Attributes resolve against a Table of the calling thread's resource, so
+    every thread uses its own Table while requests share the pool's client.
+    """
+
+    def __init__(self, pool: ClientPool, table_name: str):
+        self.pool = pool
+        self.table_name = table_name
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self._table(), name)
+
+    def _table(self):
+        table = getattr(self._local, "table", None)
+        if table is None:
+            table = self._local.table = self.pool.resource().Table(self.table_name)
+
+        return table
+
+
+def get_pool() -> ClientPool:
+    """
+    Returns the process-wide pool, created with default settings on first call
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ClientPool()
+
+        return _pool
+
+
+def configure_pool(**settings) -> ClientPool:
+    """
+    Replaces the process-wide pool, backends created before keep the previous one
+    """
+    global _pool
+
+    with _pool_lock:
+        _pool = ClientPool(**settings)
+
+        return _pool
@@ -0,0 +1,269 @@
+"""
+Compares DynamoDB storage layouts: one item per message (DBDynamo) against
+conversation buckets (DBDynamoBucketed), on an in-memory table that accounts
+read/write capacity units the way DynamoDB bills them.
+
+$ python bench_storage.py --guests 50 --messages 200
+"""
+
+from typing import Dict, List
+import argparse
+import bisect
+import math
+import time
+
+from db import DBDynamo, DBDynamoBucketed
+from models import MessageModel
+
+MAX_CHAR = chr(0x10FFFF)
+
+# modeled round trip to DynamoDB, used for the latency column
+ROUND_TRIP_MS = 5
+
+
+def item_size(value) -> int:
+    """approximates DynamoDB item size in bytes"""
+    if isinstance(value, dict):
+        return sum(len(key) + item_size(val) for key, val in value.items()) + 3
+    if isinstance(value, (list, tuple)):
+        return sum(item_size(val) + 1 for val in value) + 3
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float)):
+        return len(str(value)) // 2 + 2
+
+    return len(str(value).encode())
+
+
+class CapacityTable:
+    """
+    In-memory stand-in for a DynamoDB Table resource, accounting RCUs, WCUs and requests
+
+    Reads are billed as eventually consistent (0.5 RCU per 4KB), writes as 1 WCU per 1KB.
+    """
+
+    def __init__(self):
+        self.items = {}  # (itemType, itemID) -> item
+        self.sizes = {}  # (itemType, itemID) -> item size
+        self.keys = []  # sorted (itemType, itemID), so key conditions are range lookups
+        self.reset()
+
+    def reset(self):
+        self.rcu = 0.0
+        self.wcu = 0
+        self.requests = 0
+
+    def put_item(self, Item):
+        self.requests += 1
+        self._put(Item)
+
+    def get_item(self, Key):
+        self.requests += 1
+        key = (Key["itemType"], Key["itemID"])
+        item = self.items.get(key)
+        self.rcu += 0.5 * max(1, math.ceil(self.sizes.get(key, 0) / 4096))
+
+        return {"Item": item} if item else {}
+
+    def delete_item(self, Key):
+        self.requests += 1
+        key = (Key["itemType"], Key["itemID"])
+        if self.items.pop(key, None) is not None:
+            self.keys.pop(bisect.bisect_left(self.keys, key))
+        self.wcu += max(1, math.ceil(self.sizes.pop(key, 0) / 1024))
+
+    def query(
+        self,
+        KeyConditionExpression,
+        ScanIndexForward=True,
+        ProjectionExpression=None,
+        Limit=None,
+        **kwargs,
+    ):
+        self.requests += 1
+        matches = self._compile(KeyConditionExpression)
+        low, high = self._key_range(KeyConditionExpression)
+        keys = self.keys[
+            bisect.bisect_left(self.keys, low) : bisect.bisect_right(self.keys, high)
+        ]
+        items = [self.items[key] for key in keys if matches(self.items[key])]
+        items.sort(key=lambda item: item["itemID"], reverse=not ScanIndexForward)
+        if Limit:
+            items = items[:Limit]
+
+        size = sum(self.sizes[(item["itemType"], item["itemID"])] for item in items)
+        self.rcu += 0.5 * max(1, math.ceil(size / 4096))
+
+        if ProjectionExpression:
+            attributes = ProjectionExpression.split(",")
+            items = [{key: item[key] for key in attributes} for item in items]
+
+        return {"Items": items}
+
+    def batch_writer(self):
+        return _BatchWriter(self)
+
+    def _put(self, item):
+        key = (item["itemType"], item["itemID"])
+        if key not in self.items:
+            bisect.insort(self.keys, key)
+        self.sizes[key] = item_size(item)
+        self.items[key] = item
+        self.wcu += max(1, math.ceil(self.sizes[key] / 1024))
+
+    def _key_range(self, condition):
+        """returns lowest & highest (itemType, itemID) a key condition can match"""
+        operands = {}
+        expressions = [condition.get_expression()]
+        while expressions:
+            expression = expressions.pop()
+            if expression["operator"] == "AND":
+                expressions.extend(
+                    value.get_expression() for value in expression["values"]
+                )
+            else:
+                name, *values = expression["values"]
+                operands[name.name] = (expression["operator"], values)
+
+        partition = operands["itemType"][1][0]
+        operator, values = operands.get("itemID", (None, None))
+
+        if operator == "begins_with":
+            return (partition, values[0]), (partition, values[0] + MAX_CHAR)
+        if operator == "BETWEEN":
+            return (partition, values[0]), (partition, values[1])
+
+        return (partition, ""), (partition, MAX_CHAR)
+
+    def _compile(self, condition):
+        """turns a boto3 key condition into a predicate over items"""
+        expression = condition.get_expression()
+        operator, values = expression["operator"], expression["values"]
+
+        if operator == "AND":
+            predicates = [self._compile(value) for value in values]
+            return lambda item: all(predicate(item) for predicate in predicates)
+
+        name, operands = values[0].name, values[1:]
+        compare = {
+            "=": lambda value: value == operands[0],
+            "begins_with": lambda value: value.startswith(operands[0]),
+            "BETWEEN": lambda value: operands[0] <= value <= operands[1],
+            "<": lambda value: value < operands[0],
+            "<=": lambda value: value <= operands[0],
+            ">": lambda value: value > operands[0],
+            ">=": lambda value: value >= operands[0],
+        }[operator]
+
+        return lambda item: name in item and compare(item[name])
+
+
+class _BatchWriter:
+    """batch_writer() stand-in, sends one request per 25 items like boto3"""
+
+    def __init__(self, table: CapacityTable):
+        self.table = table
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.table.requests += math.ceil(self.count / 25)
+
+    def put_item(self, Item):
+        self.count += 1
+        self.table._put(Item)
+
+    def delete_item(self, Key):
+        self.count += 1
+        self.table.delete_item(Key)
+        # billed as part of the batch
+        self.table.requests -= 1
+
+
+def make_conversations(
+    guests: int, messages: int, host_id: str = "001"
+) -> Dict[str, List[MessageModel]]:
+    conversations = {}
+    for guest in range(guests):
+        guest_id = f"{guest:05d}"
+        conversations[guest_id] = [
+            MessageModel(
+                guest_id=guest_id,
+                # a message every 10 minutes
+                sent=1_600_000_000_000 + i * 600_000,
+                message=f"message {i} of a conversation between host and guest",
+                user="guest" if i % 2 else "owner",
+                channel="airbnb",
+            )
+            for i in range(messages)
+        ]
+
+    return conversations
+
+
+def run_benchmark(db, conversations: Dict[str, List[MessageModel]], host_id="001"):
+    """
+    Returns capacity & latency of writing conversations to db, then reading each back
+
+    Half of each conversation is written in bulk (a first sync), the rest one
+    message at a time (incremental polls).
+    """
+    table = db.table
+    result = {}
+
+    table.reset()
+    start = time.perf_counter()
+    for messages in conversations.values():
+        half = len(messages) // 2
+        db.add_messages(host_id, messages[:half])
+        for message in messages[half:]:
+            db.add_message(host_id, message)
+    result["write"] = (
+        table.wcu,
+        table.rcu,
+        table.requests,
+        time.perf_counter() - start,
+    )
+
+    table.reset()
+    start = time.perf_counter()
+    for guest_id in conversations:
+        db.messages_by_host_guest(host_id, guest_id)
+    result["read"] = (table.wcu, table.rcu, table.requests, time.perf_counter() - start)
+
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--guests", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    conversations = make_conversations(args.guests, args.messages)
+    backends = {
+        "per-item": DBDynamo(table=CapacityTable()),
+        "bucketed": DBDynamoBucketed(table=CapacityTable()),
+        "bucketed+zlib": DBDynamoBucketed(table=CapacityTable(), compress=True),
+    }
+
+    print(
+        f"{'layout':<14}{'op':<7}{'WCU':>8}{'RCU':>9}{'requests':>10}"
+        f"{'modeled ms':>12}{'cpu ms':>9}"
+    )
+    for name, db in backends.items():
+        for op, (wcu, rcu, requests, seconds) in run_benchmark(
+            db, conversations
+        ).items():
+            print(
+                f"{name:<14}{op:<7}{wcu:>8}{rcu:>9.1f}{requests:>10}"
+                f"{requests * ROUND_TRIP_MS:>12}{seconds * 1000:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
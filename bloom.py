@@ -0,0 +1,188 @@
+from typing import Dict, List, Iterable
+import hashlib
+import math
+import os
+import struct
+
+from models import MessageModel
+
+# magic, capacity, num_hashes, count, synced
+HEADER = struct.Struct(">4sQQQ?")
+MAGIC = b"BLM2"
+# files written before the synced flag, loaded as not synced
+HEADER_V1 = struct.Struct(">4sQQQ")
+MAGIC_V1 = b"BLM1"
+
+
+def message_key(host_id: str, guest_id: str, sent: int, message: str) -> str:
+    """returns dedupe key of a message, mirrors (sent, message) comparison in SyncAirbnb"""
+    return "#".join([host_id, guest_id, str(sent), message])
+
+
+class BloomFilter:
+    """
+    Probabilistic set membership over message dedupe keys
+
+    A miss is definite (key was never added), a hit only means the key was
+    probably added. Used by SyncAirbnb to skip database reads for new messages.
+
+    A miss only says the message is new if the filter holds every message of
+    the backend, so SyncAirbnb only trusts misses of a synced filter: one built
+    by from_messages(), or flagged by hand (ie. for an empty backend). save() and
+    load() keep the flag.
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.01):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = self._optimal_bits(capacity, error_rate)
+        self.num_hashes = self._optimal_hashes(self.num_bits, capacity)
+        self.count = 0
+        # filter holds every message of the backend it is paired with
+        self.synced = False
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        for index in self._indexes(key):
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def add(self, key: str):
+        bits = self._bits
+        for index in self._indexes(key):
+            bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def update(self, keys: Iterable[str]):
+        for key in keys:
+            self.add(key)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """
+        Returns estimated false positive rate given the number of keys added so far
+        """
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** (
+            self.num_hashes
+        )
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+        Returns size of the underlying bit array in bytes
+        """
+        return len(self._bits)
+
+    @property
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "capacity": self.capacity,
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "false_positive_rate": self.false_positive_rate,
+            "memory_bytes": self.memory_bytes,
+        }
+
+    @classmethod
+    def from_messages(
+        cls,
+        messages: Dict[str, Dict[str, List[MessageModel]]],
+        capacity: int = None,
+        error_rate: float = 0.01,
+    ):
+        """
+        Rebuilds a filter from a backend export, ie. DBAbstract.messages
+        """
+        keys = [
+            message_key(host_id, message.guest_id, message.sent, message.message)
+            for host_id, conversations in messages.items()
+            for conversation in conversations.values()
+            for message in conversation
+        ]
+
+        # leave headroom so the filter does not saturate right after a rebuild
+        bloom = cls(capacity or max(len(keys) * 2, 1_000), error_rate)
+        bloom.update(keys)
+        bloom.synced = True
+
+        return bloom
+
+    def save(self, path: str):
+        """
+        Persists filter to disk, written to a temp file first so readers never see a partial file
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(
+                HEADER.pack(
+                    MAGIC, self.capacity, self.num_hashes, self.count, self.synced
+                )
+            )
+            file.write(struct.pack(">d", self.error_rate))
+            file.write(self._bits)
+
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Restores a saved filter, synced only if it was synced when saved
+
+        A synced file has to be saved after the last write to its backend: a stale
+        file (older run, another writer) turns new messages into duplicate writes.
+        """
+        with open(path, "rb") as file:
+            magic = file.read(4)
+            if magic == MAGIC:
+                _, capacity, num_hashes, count, synced = HEADER.unpack(
+                    magic + file.read(HEADER.size - 4)
+                )
+            elif magic == MAGIC_V1:
+                _, capacity, num_hashes, count = HEADER_V1.unpack(
+                    magic + file.read(HEADER_V1.size - 4)
+                )
+                synced = False
+            else:
+                raise ValueError(f"{path} is not a bloom filter file")
+
+            (error_rate,) = struct.unpack(">d", file.read(8))
+            bits = file.read()
+
+        bloom = cls(capacity, error_rate)
+        if len(bits) != len(bloom._bits) or num_hashes != bloom.num_hashes:
+            raise ValueError(f"{path} does not match filter parameters")
+
+        bloom._bits = bytearray(bits)
+        bloom.count = count
+        bloom.synced = synced
+
+        return bloom
+
+    def _indexes(self, key: str):
+        # Kirsch-Mitzenmacher double hashing: k indexes out of a single 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    @staticmethod
+    def _optimal_bits(capacity, error_rate):
+        return max(
+            8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        )
+
+    @staticmethod
+    def _optimal_hashes(num_bits, capacity):
+        return max(1, int(round(num_bits / capacity * math.log(2))))
@@ -1,15 +1,58 @@
-from typing import List, Dict, Literal
+from typing import Callable, List, Dict, Literal, TYPE_CHECKING
 from abc import ABC, abstractmethod
+import bisect
+import heapq
+import importlib
+import json
+import operator
 import os
-
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
-from botocore.exceptions import ClientError
+import zlib
+import threading
 
 from models import MessageModel, GuestModel
 
-os.environ["AWS_SHARED_CREDENTIALS_FILE"] = "./credentials"
-os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+if TYPE_CHECKING:
+    from boto3.dynamodb.conditions import Attr
+    from aws import ClientPool
+
+# backend name -> "module:class", modules are only imported once a backend is created
+BACKENDS = {
+    "object": "db:DBObject",
+    "object_concurrent": "db:DBObjectConcurrent",
+    "dynamo": "db:DBDynamo",
+    "dynamo_bucketed": "db:DBDynamoBucketed",
+    "batched": "db:DBBatched",
+    "sharded": "sharding:DBSharded",
+}
+
+
+def register_backend(name: str, path: str):
+    """
+    Register a backend under name, path is "module:class"
+    """
+    BACKENDS[name] = path
+
+
+def create_backend(name: str, *args, **kwargs) -> "DBAbstract":
+    """
+    Create a backend by name, importing its module (and heavy dependencies) on first use
+    """
+    try:
+        module_name, class_name = BACKENDS[name].split(":")
+    except KeyError:
+        raise ValueError(f"unknown backend {name!r}, expected one of {list(BACKENDS)}")
+
+    backend = getattr(importlib.import_module(module_name), class_name)
+
+    return backend(*args, **kwargs)
+
+
+def configure_aws():
+    """
+    Point boto3 to the default credentials file & region, unless already set in environment
+    """
+    os.environ.setdefault("AWS_SHARED_CREDENTIALS_FILE", "./credentials")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
 
 
 class DBAbstract(ABC):
@@ -73,6 +116,44 @@ class DBAbstract(ABC):
         """
         pass
 
+    @abstractmethod
+    def recent_messages(
+        self, host_id: str, since: int = 0, limit: int = None
+    ) -> List[MessageModel]:
+        """
+        Returns newest messages across all guests of a host sent at or after since, newest first
+        """
+        pass
+
+    def add_messages(self, host_id: str, messages: List[MessageModel]):
+        """
+        Add several messages of a host into database, backends may override to write in bulk
+        """
+        for message in messages:
+            self.add_message(host_id, message)
+
+    def flush(self):
+        """
+        Commit any buffered writes, no-op for backends writing straight through
+        """
+        pass
+
+    def on_commit(self, host_id: str, callback: Callable[[], None]):
+        """
+        Run callback once the writes made so far for host_id are committed
+
+        Backends writing straight through run it right away, buffering backends
+        after their next successful flush.
+        """
+        callback()
+
+    @abstractmethod
+    def drop_host(self, host_id: str):
+        """
+        Delete all guests and messages of a host, ie. after moving it to another shard
+        """
+        pass
+
 
 class DBObject(DBAbstract):
     """
@@ -82,6 +163,8 @@ class DBObject(DBAbstract):
     def __init__(self):
         self._messages = {}
         self._guests = {}
+        # host_id -> (sorted (sent, message, guest_id) keys, messages in the same order)
+        self._recent = {}
 
     @property
     def messages(self):
@@ -121,12 +204,25 @@ class DBObject(DBAbstract):
             self._add_host(host_id)
 
         guest_id = guest.guest_id
+        if self._messages[host_id].get(guest_id):
+            # messages of a re-added guest are reset, so are their index entries
+            self._unindex_guest(host_id, guest_id)
         self._messages[host_id][guest_id] = []
         self._guests[host_id][guest_id] = guest
 
     def add_message(self, host_id: str, message: MessageModel):
         guest_id = message.guest_id
         self._messages[host_id][guest_id].append(message)
+        self._index_message(host_id, message)
+
+    def recent_messages(self, host_id: str, since: int = 0, limit: int = None):
+        keys, messages = self._recent.get(host_id, ([], []))
+
+        start = bisect.bisect_left(keys, (since,))
+        if limit is not None:
+            start = max(start, len(keys) - limit)
+
+        return messages[start:][::-1]
 
     def update_guest_stat(
         self,
@@ -140,6 +236,25 @@ class DBObject(DBAbstract):
         guest.updated_at = new_updated_at
         guest.total_msgs = new_total_messages
 
+    def drop_host(self, host_id: str):
+        self._messages.pop(host_id, None)
+        self._guests.pop(host_id, None)
+        self._recent.pop(host_id, None)
+
+    def _unindex_guest(self, host_id: str, guest_id: str):
+        keys, messages = self._recent.get(host_id, ([], []))
+        kept = [i for i, key in enumerate(keys) if key[2] != guest_id]
+
+        self._recent[host_id] = ([keys[i] for i in kept], [messages[i] for i in kept])
+
+    def _index_message(self, host_id: str, message: MessageModel):
+        keys, messages = self._recent.setdefault(host_id, ([], []))
+
+        key = (message.sent, message.message, message.guest_id)
+        index = bisect.bisect_right(keys, key)
+        keys.insert(index, key)
+        messages.insert(index, message)
+
     def _sort_messages(self, messages: List[MessageModel]):
         messages_sorted = sorted(
             messages, key=lambda msg: (msg.sent, msg.message), reverse=True
@@ -151,12 +266,153 @@ class DBObject(DBAbstract):
         self._guests[host_id] = {}
 
 
+class DBObjectConcurrent(DBObject):
+    """
+    Thread-safe implementation of database using object
+
+    Writers only lock the stripe their host hashes to, so writers of different
+    hosts rarely wait on each other. Readers don't lock: they copy dicts and
+    lists before iterating them, which is atomic under the GIL, and stored
+    messages & guests are never mutated in place.
+    """
+
+    def __init__(self, stripes: int = 64):
+        super().__init__()
+        # host_id -> {guest_id -> {(sent, message)}}, hosts only added under _hosts_lock
+        self._message_keys = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        # only taken when a new host is added
+        self._hosts_lock = threading.Lock()
+
+    @property
+    def messages(self):
+        messages_sorted = {}
+        for host_id, data in list(self._messages.items()):
+            messages_sorted[host_id] = {
+                guest_id: self._sort_messages(messages)
+                for guest_id, messages in list(data.items())
+            }
+
+        return messages_sorted
+
+    @property
+    def guests(self):
+        return {host_id: dict(guests) for host_id, guests in list(self._guests.items())}
+
+    def messages_by_host_guest(self, host_id: str, guest_id: str):
+        messages = self._messages.get(host_id, {}).get(guest_id, [])
+
+        return self._sort_messages(messages)
+
+    def guests_by_host(self, host_id: str):
+        guests = list(self._guests.get(host_id, {}).values())
+
+        return sorted(guests, key=lambda guest: guest.updated_at, reverse=True)
+
+    def add_guest(self, host_id: str, guest: GuestModel):
+        with self._lock(host_id):
+            # unlike DBObject, messages of an existing guest are kept
+            self._ensure_conversation(host_id, guest.guest_id)
+            self._guests[host_id][guest.guest_id] = guest
+
+    def add_message(self, host_id: str, message: MessageModel):
+        # same (sent, message) identity SyncAirbnb compares on, so parallel syncs can't duplicate
+        self.add_message_if_absent(host_id, message)
+
+    def add_message_if_absent(self, host_id: str, message: MessageModel) -> bool:
+        """
+        Atomically adds message unless one with same sent & message exists, returns whether it was added
+        """
+        guest_id = message.guest_id
+        key = (message.sent, message.message)
+
+        with self._lock(host_id):
+            self._ensure_conversation(host_id, guest_id)
+
+            keys = self._message_keys[host_id][guest_id]
+            if key in keys:
+                return False
+
+            keys.add(key)
+            self._messages[host_id][guest_id].append(message)
+            self._index_message(host_id, message)
+
+        return True
+
+    def recent_messages(self, host_id: str, since: int = 0, limit: int = None):
+        # index lists are shifted by insert, so unlike other reads this one locks
+        with self._lock(host_id):
+            return super().recent_messages(host_id, since, limit)
+
+    def update_guest_stat(
+        self,
+        host_id: str,
+        guest_id: str,
+        old_updated_at: int,
+        new_updated_at: int,
+        new_total_messages: int,
+    ):
+        with self._lock(host_id):
+            guests = self._guests[host_id]
+            guests[guest_id] = guests[guest_id].copy(
+                update={"updated_at": new_updated_at, "total_msgs": new_total_messages}
+            )
+
+    def drop_host(self, host_id: str):
+        with self._lock(host_id), self._hosts_lock:
+            super().drop_host(host_id)
+            self._message_keys.pop(host_id, None)
+
+    def _lock(self, host_id: str) -> threading.Lock:
+        return self._locks[hash(host_id) % len(self._locks)]
+
+    def _ensure_conversation(self, host_id: str, guest_id: str):
+        # caller holds the host's stripe lock
+        if host_id not in self._messages:
+            with self._hosts_lock:
+                self._guests[host_id] = {}
+                self._messages[host_id] = {}
+                self._message_keys[host_id] = {}
+
+        conversations = self._messages[host_id]
+        if guest_id not in conversations:
+            self._message_keys[host_id][guest_id] = set()
+            conversations[guest_id] = []
+
+
 class DBDynamo(DBAbstract):
     """
     Implementation of database using DynamoDB
     """
 
-    def __init__(self, table_name):
+    # item types stored by this backend, ie. what drop_host() has to delete
+    item_types = ["guest", "msg", "recent"]
+
+    def __init__(
+        self,
+        table_name: str = None,
+        table=None,
+        shard: int = None,
+        pool: "ClientPool" = None,
+    ):
+        # partition key shard, items are stored under "guest#<shard>" / "msg#<shard>"
+        # so several DBDynamo instances can share one table without a single hot partition
+        self.shard = shard
+        self.pool = pool
+
+        if table is not None:
+            # an existing Table resource (or anything exposing the same methods)
+            self.table = table
+            return
+
+        # boto3 is slow to import, only pay for it once a DynamoDB backend is created
+        from botocore.exceptions import ClientError
+        import aws
+
+        configure_aws()
+        # connections are shared with every other DBDynamo of the process
+        self.pool = pool or aws.get_pool()
+
         try:
             # connect to an existing DynamoDB with specified name
             self.table = self._connect_table(table_name)
@@ -209,7 +465,7 @@ class DBDynamo(DBAbstract):
         return data
 
     def guests_by_host(self, host_id: str):
-        data = self._query_table("guest", get_attributes=["itemData"])
+        data = self._query_table("guest", f"{host_id}#", ["itemData"])
         data = [item["itemData"] for item in data]
         data = [GuestModel(**guest) for guest in data]
 
@@ -221,7 +477,7 @@ class DBDynamo(DBAbstract):
 
         self.table.put_item(
             Item={
-                "itemType": "guest",
+                "itemType": self._pk("guest"),
                 "itemID": key,
                 "itemData": guest.dict(),
             }
@@ -237,11 +493,78 @@ class DBDynamo(DBAbstract):
 
         self.table.put_item(
             Item={
-                "itemType": "msg",
+                "itemType": self._pk("msg"),
                 "itemID": key,
                 "itemData": message.dict(),
             }
         )
+        self._put_recent(self.table, host_id, message)
+
+    def add_messages(self, host_id: str, messages: List[MessageModel]):
+        # one read per conversation to work out key suffixes, instead of one per message
+        suffixes = {}
+        for guest_id in {message.guest_id for message in messages}:
+            data = self._query_table("msg", f"{host_id}#{guest_id}#", ["itemID"])
+            for item in data:
+                _, _, sent, _ = item["itemID"].split("#")
+                suffixes[(guest_id, sent)] = suffixes.get((guest_id, sent), 0) + 1
+
+        with self.table.batch_writer() as batch:
+            for message in messages:
+                guest_id, sent = message.guest_id, str(message.sent)
+                suffix = suffixes.get((guest_id, sent), 0)
+                suffixes[(guest_id, sent)] = suffix + 1
+
+                batch.put_item(
+                    Item={
+                        "itemType": self._pk("msg"),
+                        "itemID": "#".join([host_id, guest_id, sent, str(suffix)]),
+                        "itemData": message.dict(),
+                    }
+                )
+                self._put_recent(batch, host_id, message)
+
+    def recent_messages(self, host_id: str, since: int = 0, limit: int = None):
+        from boto3.dynamodb.conditions import Key
+
+        if limit == 0:
+            # DynamoDB rejects Limit=0
+            return []
+
+        # one range read over the host's slice of the time-ordered index
+        query_parameters = {
+            "KeyConditionExpression": Key("itemType").eq(self._pk("recent"))
+            & Key("itemID").between(f"{host_id}#{since:013d}", f"{host_id}#~"),
+            "ScanIndexForward": False,
+            "ProjectionExpression": "itemData",
+        }
+
+        data = []
+        while True:
+            if limit is not None:
+                query_parameters["Limit"] = limit - len(data)
+
+            response = self.table.query(**query_parameters)
+            data.extend(response["Items"])
+
+            if "LastEvaluatedKey" not in response or (
+                limit is not None and len(data) >= limit
+            ):
+                break
+            query_parameters["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        return [MessageModel(**item["itemData"]) for item in data]
+
+    def drop_host(self, host_id: str):
+        keys = [
+            (self._pk(item_type), item["itemID"])
+            for item_type in self.item_types
+            for item in self._query_table(item_type, f"{host_id}#", ["itemID"])
+        ]
+
+        with self.table.batch_writer() as batch:
+            for item_type, item_id in keys:
+                batch.delete_item(Key={"itemType": item_type, "itemID": item_id})
 
     def update_guest_stat(
         self,
@@ -254,7 +577,7 @@ class DBDynamo(DBAbstract):
         # find old record
         old_key = {
             "Key": {
-                "itemType": "guest",
+                "itemType": self._pk("guest"),
                 "itemID": "#".join([host_id, str(old_updated_at), guest_id]),
             }
         }
@@ -272,7 +595,7 @@ class DBDynamo(DBAbstract):
         # add new record
         self.table.put_item(
             Item={
-                "itemType": "guest",
+                "itemType": self._pk("guest"),
                 "itemID": "#".join([host_id, str(new_updated_at), guest_id]),
                 "itemData": new_guest.dict(),
             }
@@ -280,20 +603,24 @@ class DBDynamo(DBAbstract):
 
     def _query_table(
         self,
-        partition_key: Literal["guest", "msg"],
+        partition_key: Literal["guest", "msg", "conv"],
         sort_key: str = None,
         get_attributes: list = None,
-        filter_exp: Attr = None,
+        filter_exp: "Attr" = None,
     ):
+        from boto3.dynamodb.conditions import Key
+
         query_parameters = {
-            "KeyConditionExpression": Key("itemType").eq(partition_key),
+            "KeyConditionExpression": Key("itemType").eq(self._pk(partition_key)),
             "ScanIndexForward": False,
         }
 
         if sort_key:
             query_parameters.update(
                 {
-                    "KeyConditionExpression": Key("itemType").eq(partition_key)
+                    "KeyConditionExpression": Key("itemType").eq(
+                        self._pk(partition_key)
+                    )
                     & Key("itemID").begins_with(sort_key)
                 }
             )
@@ -309,14 +636,32 @@ class DBDynamo(DBAbstract):
 
         # append data if response is paginated
         while "LastEvaluatedKey" in response:
-            response = self.table.query(ExclusiveStartKey=response["LastEvaluatedKey"])
+            response = self.table.query(
+                ExclusiveStartKey=response["LastEvaluatedKey"], **query_parameters
+            )
             data.extend(response["Items"])
 
         return data
 
+    def _put_recent(self, writer, host_id: str, message: MessageModel):
+        """
+        Writes a message into the per-host time-ordered index, writer is the table or a batch
+        """
+        # same message always gets the same key, so rewriting it is idempotent
+        digest = zlib.crc32(message.message.encode())
+        writer.put_item(
+            Item={
+                "itemType": self._pk("recent"),
+                "itemID": f"{host_id}#{message.sent:013d}#{message.guest_id}#{digest:08x}",
+                "itemData": message.dict(),
+            }
+        )
+
+    def _pk(self, item_type: str) -> str:
+        return item_type if self.shard is None else f"{item_type}#{self.shard}"
+
     def _create_table(self, table_name):
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.create_table(
+        table = self.pool.resource().create_table(
             TableName=table_name,
             KeySchema=[
                 {"AttributeName": "itemType", "KeyType": "HASH"},
@@ -331,10 +676,340 @@ class DBDynamo(DBAbstract):
 
         table.meta.client.get_waiter("table_exists").wait(TableName=table_name)
 
-        return table
+        return self.pool.table(table_name)
 
     def _connect_table(self, table_name: str):
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(table_name)
+        return self.pool.table(table_name)
+
+
+class DBDynamoBucketed(DBDynamo):
+    """
+    Implementation of database using DynamoDB, with messages packed into conversation buckets
+
+    Each item holds the messages of one conversation sent within the same time
+    window, up to max_bucket_bytes (a window overflowing that gets more parts).
+    Reading a conversation touches a few items instead of one per message,
+    and bulk appends rewrite each touched bucket once.
+    """
+
+    item_types = ["guest", "conv", "recent"]
+
+    def __init__(
+        self,
+        table_name: str = None,
+        table=None,
+        window_ms: int = 7 * 24 * 3600 * 1000,
+        max_bucket_bytes: int = 350_000,
+        compress: bool = False,
+        shard: int = None,
+        pool: "ClientPool" = None,
+    ):
+        super().__init__(table_name, table, shard, pool)
+        self.window_ms = window_ms
+        # DynamoDB items are capped at 400KB, leave room for keys & attribute names
+        self.max_bucket_bytes = max_bucket_bytes
+        self.compress = compress
+
+    @property
+    def messages(self):
+        result = {}
+
+        for item in self._query_table("conv"):
+            host_id, guest_id, *_ = item["itemID"].split("#")
+            result.setdefault(host_id, {}).setdefault(guest_id, []).extend(
+                self._decode(item["itemData"])
+            )
+
+        # buckets hold messages oldest first, newest first like the other backends
+        for conversations in result.values():
+            for guest_id, messages in conversations.items():
+                conversations[guest_id] = self._sort_messages(messages)
+
+        return result
+
+    def messages_by_host_guest(self, host_id: str, guest_id: str):
+        data = self._query_table("conv", f"{host_id}#{guest_id}#", ["itemData"])
+        data = [msg for item in data for msg in self._decode(item["itemData"])]
+
+        return self._sort_messages(data)
+
+    def add_message(self, host_id: str, message: MessageModel):
+        self.add_messages(host_id, [message])
+
+    def add_messages(self, host_id: str, messages: List[MessageModel]):
+        buckets = {}
+        for message in messages:
+            window = message.sent - message.sent % self.window_ms
+            buckets.setdefault((message.guest_id, window), []).append(message)
+
+        for (guest_id, window), new_messages in buckets.items():
+            prefix = f"{host_id}#{guest_id}#{window:013d}#"
+            parts = self._query_table("conv", prefix)
+
+            # appends go to the newest part of the window
+            if parts:
+                newest = max(parts, key=lambda item: item["itemID"])
+                part = int(newest["itemID"].rsplit("#", 1)[1])
+                # kept as plain dicts, appends don't need to validate existing messages
+                bucket = self._load(newest["itemData"])
+                size = int(newest["itemData"]["size"])
+            else:
+                part, bucket, size = 0, [], 0
+
+            for message in new_messages:
+                message = message.dict()
+                # uncompressed size, so compressed buckets stay well under the cap
+                message_size = len(json.dumps(message)) + 2
+                if bucket and size + message_size > self.max_bucket_bytes:
+                    self._put_bucket(f"{prefix}{part:04d}", bucket, size)
+                    part, bucket, size = part + 1, [], 0
+
+                bucket.append(message)
+                size += message_size
+
+            self._put_bucket(f"{prefix}{part:04d}", bucket, size)
+
+        with self.table.batch_writer() as batch:
+            for message in messages:
+                self._put_recent(batch, host_id, message)
+
+    def _put_bucket(self, key: str, messages: List[dict], size: int):
+        if self.compress:
+            data = {"zlib": zlib.compress(json.dumps(messages).encode()), "size": size}
+        else:
+            data = {"messages": messages, "size": size}
+
+        self.table.put_item(
+            Item={"itemType": self._pk("conv"), "itemID": key, "itemData": data}
+        )
+
+    def _load(self, item_data) -> List[dict]:
+        if "zlib" in item_data:
+            # boto3 wraps binary attributes into Binary
+            blob = getattr(item_data["zlib"], "value", item_data["zlib"])
+            return json.loads(zlib.decompress(blob))
+
+        return list(item_data["messages"])
+
+    def _decode(self, item_data) -> List[MessageModel]:
+        return [MessageModel(**message) for message in self._load(item_data)]
+
+    def _sort_messages(self, messages: List[MessageModel]):
+        return sorted(messages, key=lambda msg: (msg.sent, msg.message), reverse=True)
+
+
+class DBBatched(DBAbstract):
+    """
+    Buffers writes to another database and commits them in batches
+
+    Reads see buffered writes, and messages buffered more than once (ie. the same
+    message reported by two pollers) are only written once.
+    """
+
+    def __init__(self, db: DBAbstract, batch_size: int = 100):
+        self.db = db
+        self.batch_size = batch_size
+
+        self._lock = threading.RLock()
+        self._new_guests = {}  # (host_id, guest_id) -> GuestModel
+        # (host_id, guest_id) -> [old_updated_at, new_updated_at, total]
+        self._guest_stats = {}
+        self._new_messages = {}  # (host_id, guest_id) -> List[MessageModel]
+        self._message_keys = set()
+        self._pending = 0
+        self._on_commit = []  # callbacks waiting for the next flush
+
+    @property
+    def messages(self):
+        self.flush()
+        return self.db.messages
+
+    @property
+    def guests(self):
+        self.flush()
+        return self.db.guests
+
+    def messages_by_host_guest(self, host_id: str, guest_id: str):
+        with self._lock:
+            pending = list(self._new_messages.get((host_id, guest_id), []))
+            new_guest = (host_id, guest_id) in self._new_guests
+
+        # guest not committed yet, so database can't hold any of its messages
+        messages = (
+            [] if new_guest else self.db.messages_by_host_guest(host_id, guest_id)
+        )
+
+        return sorted(
+            messages + pending, key=lambda msg: (msg.sent, msg.message), reverse=True
+        )
+
+    def guests_by_host(self, host_id: str):
+        guests = self.db.guests_by_host(host_id)
+
+        with self._lock:
+            result = []
+            for guest in guests:
+                stat = self._guest_stats.get((host_id, guest.guest_id))
+                if stat:
+                    guest = guest.copy(
+                        update={"updated_at": stat[1], "total_msgs": stat[2]}
+                    )
+                result.append(guest)
+
+            result.extend(
+                guest
+                for (host, _), guest in self._new_guests.items()
+                if host == host_id
+            )
+
+        return sorted(result, key=lambda guest: guest.updated_at, reverse=True)
+
+    def add_guest(self, host_id: str, guest: GuestModel):
+        with self._lock:
+            self._new_guests[(host_id, guest.guest_id)] = guest
+            self._added()
+
+    def add_message(self, host_id: str, message: MessageModel):
+        key = (host_id, message.guest_id, message.sent, message.message)
+
+        with self._lock:
+            if key in self._message_keys:
+                return
+
+            self._message_keys.add(key)
+            self._new_messages.setdefault((host_id, message.guest_id), []).append(
+                message
+            )
+            self._added()
+
+    def update_guest_stat(
+        self,
+        host_id: str,
+        guest_id: str,
+        old_updated_at: int,
+        new_updated_at: int,
+        new_total_messages: int,
+    ):
+        key = (host_id, guest_id)
+
+        with self._lock:
+            if key in self._new_guests:
+                guest = self._new_guests[key]
+                guest.updated_at = new_updated_at
+                guest.total_msgs = new_total_messages
+                return
+
+            if key in self._guest_stats:
+                # keep the committed updated_at, that's what the database knows about
+                old_updated_at = self._guest_stats[key][0]
+
+            self._guest_stats[key] = [
+                old_updated_at,
+                new_updated_at,
+                new_total_messages,
+            ]
+            self._added()
+
+    def flush(self):
+        """
+        Commits buffered writes, a failed write puts what's not committed back in the buffer
+
+        The failing write is retried in full by the next flush, so a bulk write
+        that failed halfway may write some messages twice on backends without
+        idempotent writes. Callbacks run only once everything is committed.
+        """
+        with self._lock:
+            new_guests, self._new_guests = self._new_guests, {}
+            guest_stats, self._guest_stats = self._guest_stats, {}
+            new_messages, self._new_messages = self._new_messages, {}
+            callbacks, self._on_commit = self._on_commit, []
+            self._message_keys = set()
+            self._pending = 0
+
+            try:
+                # guests go first, backends may expect a guest before its messages
+                for key, guest in list(new_guests.items()):
+                    self.db.add_guest(key[0], guest)
+                    del new_guests[key]
+
+                for key, stat in list(guest_stats.items()):
+                    self.db.update_guest_stat(*key, *stat)
+                    del guest_stats[key]
+
+                by_host = {}
+                for key in new_messages:
+                    by_host.setdefault(key[0], []).append(key)
+
+                for host_id, keys in by_host.items():
+                    self.db.add_messages(
+                        host_id, [msg for key in keys for msg in new_messages[key]]
+                    )
+                    for key in keys:
+                        del new_messages[key]
+            except Exception:
+                self._restore(new_guests, guest_stats, new_messages, callbacks)
+                raise
+
+        try:
+            self.db.flush()
+        except Exception:
+            with self._lock:
+                self._on_commit[:0] = callbacks
+            raise
+
+        # only reached once the batch is committed
+        for callback in callbacks:
+            callback()
+
+    def on_commit(self, host_id: str, callback: Callable[[], None]):
+        with self._lock:
+            self._on_commit.append(callback)
+
+    def recent_messages(self, host_id: str, since: int = 0, limit: int = None):
+        with self._lock:
+            pending = [
+                message
+                for (host, _), messages in self._new_messages.items()
+                if host == host_id
+                for message in messages
+                if message.sent >= since
+            ]
+
+        key = operator.attrgetter("sent", "message", "guest_id")
+        pending.sort(key=key, reverse=True)
+
+        # k-way merge of committed & buffered messages, both newest first
+        merged = heapq.merge(
+            self.db.recent_messages(host_id, since, limit),
+            pending,
+            key=key,
+            reverse=True,
+        )
+
+        return list(merged)[:limit]
+
+    def drop_host(self, host_id: str):
+        self.flush()
+        self.db.drop_host(host_id)
+
+    def _restore(self, new_guests, guest_stats, new_messages, callbacks):
+        """puts uncommitted writes of a failed flush back, caller holds the lock"""
+        self._new_guests = new_guests
+        self._guest_stats = guest_stats
+        self._new_messages = new_messages
+        self._on_commit = callbacks
+        self._message_keys = {
+            (host_id, msg.guest_id, msg.sent, msg.message)
+            for (host_id, _), messages in new_messages.items()
+            for msg in messages
+        }
+        self._pending = (
+            len(new_guests)
+            + len(guest_stats)
+            + sum(len(messages) for messages in new_messages.values())
+        )
 
-        return table
+    def _added(self):
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
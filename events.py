@@ -0,0 +1,259 @@
+from typing import Iterator, List, Literal
+import json
+import os
+import queue
+import threading
+
+from models import ChangeEvent
+
+_CLOSED = object()
+
+# longest an async consumer's worker thread waits, so cancelled consumers free it quickly
+ASYNC_POLL_SECONDS = 0.1
+
+
+class ChangeLog:
+    """
+    Append-only, file-backed log of change events, one JSON line per event
+
+    Offsets are line numbers, so a restarted consumer can resume from the last
+    offset it processed.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+
+        self.next_offset = 0
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                self.next_offset = sum(1 for _ in file)
+
+        self._file = open(path, "a", encoding="utf-8")
+
+    def append(self, event: ChangeEvent) -> ChangeEvent:
+        with self._lock:
+            event = event.copy(update={"offset": self.next_offset})
+            self._file.write(event.json() + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+            self.next_offset += 1
+
+        return event
+
+    def read(self, offset: int = 0, until: int = None) -> Iterator[ChangeEvent]:
+        """
+        Yields events from offset (inclusive) to until (exclusive)
+        """
+        with open(self.path, encoding="utf-8") as file:
+            for line_offset, line in enumerate(file):
+                if until is not None and line_offset >= until:
+                    return
+                if line_offset >= offset:
+                    yield ChangeEvent(**json.loads(line))
+
+    def close(self):
+        self._file.close()
+
+
+class Subscription:
+    """
+    Bounded queue of events for one consumer, read in batches
+
+    With overflow="block", publishers wait while the queue is full (backpressure),
+    up to the bus's publish_timeout, after which the event is dropped and counted;
+    with overflow="drop", the oldest queued event is dropped and counted instead.
+    """
+
+    def __init__(
+        self,
+        bus: "EventBus",
+        maxsize: int = 1000,
+        batch_size: int = 100,
+        overflow: Literal["block", "drop"] = "block",
+        replay: Iterator[ChangeEvent] = None,
+    ):
+        self.bus = bus
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.offset = None  # offset of last delivered event
+        self.dropped = 0
+        self.closed = False
+
+        self._queue = queue.Queue(maxsize)
+        self._replay = replay
+
+    def get_batch(self, timeout: float = None) -> List[ChangeEvent]:
+        """
+        Returns up to batch_size events, waits up to timeout for the first one
+
+        Returns an empty list on timeout or once the subscription is closed.
+        """
+        batch = self._next_replay()
+
+        if not batch:
+            try:
+                event = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                return batch
+
+            while event is not _CLOSED:
+                batch.append(event)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if event is _CLOSED:
+                self.closed = True
+
+        if batch and batch[-1].offset is not None:
+            self.offset = batch[-1].offset
+
+        return batch
+
+    async def aget_batch(self, timeout: float = None) -> List[ChangeEvent]:
+        """
+        Async get_batch, events are taken on the event loop, so cancelling loses none
+        """
+        # asyncio is slow to import, only pay for it with async consumers
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        while True:
+            batch = self.get_batch(timeout=0)
+            if batch or self.closed:
+                return batch
+
+            wait = ASYNC_POLL_SECONDS
+            if deadline is not None:
+                wait = min(wait, deadline - loop.time())
+                if wait <= 0:
+                    return batch
+
+            # blocks a worker thread for a bounded time, without taking any event
+            await loop.run_in_executor(None, self._wait_ready, wait)
+
+    def __iter__(self) -> Iterator[List[ChangeEvent]]:
+        while not self.closed:
+            batch = self.get_batch()
+            if batch:
+                yield batch
+
+    async def __aiter__(self):
+        while not self.closed:
+            batch = await self.aget_batch()
+            if batch:
+                yield batch
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        while True:
+            try:
+                self._queue.put_nowait(_CLOSED)
+                return
+            except queue.Full:
+                self._drop_oldest()
+
+    def _put(self, event: ChangeEvent, timeout: float = None):
+        if self.overflow == "block":
+            try:
+                self._queue.put(event, timeout=timeout)
+            except queue.Full:
+                # consumer stalled past publish_timeout, drop the event rather than
+                # fail the publisher, whose write is already done
+                self.dropped += 1
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                self._drop_oldest()
+
+    def _wait_ready(self, timeout: float):
+        """waits up to timeout for an event to be queued, leaves it in the queue"""
+        not_empty = self._queue.not_empty
+        with not_empty:
+            if not self._queue._qsize():
+                not_empty.wait(timeout)
+
+    def _drop_oldest(self):
+        try:
+            self._queue.get_nowait()
+            self.dropped += 1
+        except queue.Empty:
+            pass
+
+    def _next_replay(self) -> List[ChangeEvent]:
+        batch = []
+        if self._replay is None:
+            return batch
+
+        for event in self._replay:
+            batch.append(event)
+            if len(batch) >= self.batch_size:
+                return batch
+
+        self._replay = None
+        return batch
+
+
+class EventBus:
+    """
+    In-process publish/subscribe of change events
+
+    With a ChangeLog, every event is persisted before delivery and gets an
+    offset, and subscribers can start from an earlier offset.
+    """
+
+    def __init__(self, log: ChangeLog = None, publish_timeout: float = None):
+        self.log = log
+        # how long a publisher waits on a full "block" subscription, None waits forever
+        self.publish_timeout = publish_timeout
+
+        self._lock = threading.Lock()
+        self._subscriptions = []
+
+    def subscribe(
+        self,
+        maxsize: int = 1000,
+        batch_size: int = 100,
+        overflow: Literal["block", "drop"] = "block",
+        from_offset: int = None,
+    ) -> Subscription:
+        with self._lock:
+            replay = None
+            if from_offset is not None:
+                if self.log is None:
+                    raise ValueError("resuming from an offset requires a ChangeLog")
+                # events past next_offset are delivered live, through the queue
+                replay = self.log.read(from_offset, until=self.log.next_offset)
+
+            subscription = Subscription(self, maxsize, batch_size, overflow, replay)
+            self._subscriptions.append(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, event: ChangeEvent):
+        with self._lock:
+            if self.log is not None:
+                event = self.log.append(event)
+            subscriptions = list(self._subscriptions)
+
+        # delivered outside the lock, a blocked subscriber must not stall subscribe()
+        for subscription in subscriptions:
+            subscription._put(event, self.publish_timeout)
@@ -58,3 +58,11 @@ class GuestModel(BaseModel):
     updated_at: int  # milliseconds timestamp
     total_msgs: int
     name: str
+
+
+class ChangeEvent(BaseModel):
+    kind: Literal["message.created", "guest.created", "guest.updated"]
+    host_id: str
+    guest_id: str
+    data: dict  # MessageModel / GuestModel fields
+    offset: int = None  # position in change log, set when published
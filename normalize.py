@@ -0,0 +1,127 @@
+from typing import Callable, List, Tuple
+from concurrent.futures import Executor
+
+import utils
+
+# (guest_id, host_id, updated_at, guest_name, ((message, sent, user_id), ...))
+ThreadRecord = Tuple[int, int, int, str, Tuple[Tuple[str, int, int], ...]]
+
+
+def normalize_thread(thread: dict) -> ThreadRecord:
+    """
+    Parses a raw airbnb thread into a compact record, runs inside pool workers
+
+    Mirrors AirbnbThread / AirbnbMessage accessors, so records compare the same way.
+    """
+    try:
+        host_id = next(
+            r["user_ids"][0]
+            for r in thread["attachment"]["roles"]
+            if r["role"] == "owner"
+        )
+        guest_name = next(
+            u["first_name"] for u in thread["users"] if u["id"] != host_id
+        )
+        messages = tuple(
+            (str(m["message"]), utils.parse_timestr(m["created_at"]), m["user_id"])
+            for m in thread["messages"]
+        )
+
+        return (
+            thread["id"],
+            host_id,
+            utils.parse_timestr(thread["last_message_sent_at"]),
+            str(guest_name),
+            messages,
+        )
+    except (KeyError, IndexError, StopIteration, TypeError, ValueError) as e:
+        thread_id = thread.get("id") if isinstance(thread, dict) else thread
+        raise ValueError(f"malformed thread {thread_id!r}: {e!r}") from e
+
+
+def normalize_threads(
+    threads: List,
+    executor: Executor = None,
+    chunksize: int = 64,
+    normalizer: Callable[..., ThreadRecord] = normalize_thread,
+) -> List["RecordThread"]:
+    """
+    Normalizes threads across a process pool, small payloads are normalized in-process
+
+    normalizer gets each thread's raw payload (thread.thread, or the thread itself),
+    it has to be picklable, ie. a module level function. The default accepts
+    AirbnbThread objects or raw airbnb thread dicts.
+    """
+    raw = [getattr(thread, "thread", thread) for thread in threads]
+
+    if executor is None or len(raw) < chunksize * 2:
+        records = map(normalizer, raw)
+    else:
+        records = executor.map(normalizer, raw, chunksize=chunksize)
+
+    return [RecordThread(record) for record in records]
+
+
+class RecordThread:
+    """exposes a ThreadRecord through AirbnbThread accessors"""
+
+    __slots__ = ("record", "_messages")
+
+    def __init__(self, record: ThreadRecord):
+        self.record = record
+        self._messages = [RecordMessage(m) for m in record[4]]
+
+    @classmethod
+    def from_thread(cls, thread) -> "RecordThread":
+        """
+        Resolves every accessor of a thread once, ie. parses AirbnbThread timestamps
+        """
+        if isinstance(thread, cls):
+            return thread
+
+        messages = tuple(
+            (m.message(), m.sent(), m.user_id()) for m in thread.messages()
+        )
+
+        return cls(
+            (
+                thread.guest_id(),
+                thread.host_id(),
+                thread.updated_at(),
+                thread.guest_name(),
+                messages,
+            )
+        )
+
+    def guest_id(self):
+        return self.record[0]
+
+    def host_id(self):
+        return self.record[1]
+
+    def updated_at(self):
+        return self.record[2]
+
+    def guest_name(self):
+        return self.record[3]
+
+    def messages(self):
+        return self._messages
+
+
+class RecordMessage:
+    """exposes a message record through AirbnbMessage accessors"""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record):
+        self.record = record
+
+    def message(self):
+        return self.record[0]
+
+    def sent(self):
+        return self.record[1]
+
+    def user_id(self):
+        return self.record[2]
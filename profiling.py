@@ -0,0 +1,205 @@
+from typing import Dict, List, Tuple
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import cProfile
+import heapq
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger()
+
+_NULL_CONTEXT = nullcontext()
+
+# default of SyncProfiler.report(), steps themselves can be anything, None included
+ALL_STEPS = object()
+
+
+class NullProfiler:
+    """default profiler of SyncAirbnb, every hook is a shared no-op context"""
+
+    enabled = False
+
+    def stage(self, name: str, host_id: str = None):
+        return _NULL_CONTEXT
+
+    def thread(self, host_id: str, guest_id: str):
+        return _NULL_CONTEXT
+
+    def run(self, step):
+        return _NULL_CONTEXT
+
+
+class SyncProfiler(NullProfiler):
+    """
+    Collects stage timings of SyncAirbnb runs
+
+    Stages are fetch, parse, compare and write. Timings are exclusive: time spent
+    in a nested stage (ie. a write triggered by a compare) is only charged to the
+    nested stage. They are kept per step (set by run()) and per host. Optionally
+    writes a cProfile file per run to profile_dir.
+    """
+
+    enabled = True
+
+    def __init__(self, profile_dir: str = None, slow_threads: int = 10):
+        self.profile_dir = profile_dir
+        self.slow_threads_limit = slow_threads
+
+        self.timings = defaultdict(float)  # (step, stage, host_id) -> seconds
+        self.counts = defaultdict(int)  # (step, stage, host_id) -> calls
+        self.profiles = []  # paths of written profile files
+        self.step = None  # step of the current run, None outside of run()
+
+        self._slow_threads = []  # min-heap of (seconds, host_id, guest_id)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name: str, host_id: str = None):
+        stack = self._stack()
+        now = time.perf_counter()
+        if stack:
+            self._charge(stack[-1], now)
+
+        frame = [(self.step, name, host_id), now]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            stack.pop()
+            self._charge(frame, now)
+
+            with self._lock:
+                self.counts[frame[0]] += 1
+
+            if stack:
+                # resume parent stage
+                stack[-1][1] = now
+
+    @contextmanager
+    def thread(self, host_id: str, guest_id: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = (time.perf_counter() - start, host_id, guest_id)
+
+            with self._lock:
+                if len(self._slow_threads) < self.slow_threads_limit:
+                    heapq.heappush(self._slow_threads, entry)
+                elif self.slow_threads_limit:
+                    heapq.heappushpop(self._slow_threads, entry)
+
+    @contextmanager
+    def run(self, step):
+        previous, self.step = self.step, step
+        try:
+            if not self.profile_dir:
+                yield
+                return
+
+            with self._profile(step):
+                yield
+        finally:
+            self.step = previous
+
+    @contextmanager
+    def _profile(self, step):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+            os.makedirs(self.profile_dir, exist_ok=True)
+            timestamp = time.strftime("%Y%m%dT%H%M%S")
+            path = os.path.join(
+                self.profile_dir,
+                f"sync-step{step}-{timestamp}-{len(self.profiles)}.prof",
+            )
+            profile.dump_stats(path)
+            self.profiles.append(path)
+
+    @property
+    def slow_threads(self) -> List[Tuple[float, str, str]]:
+        """
+        Returns slowest threads as (seconds, host_id, guest_id), slowest first
+        """
+        with self._lock:
+            return sorted(self._slow_threads, reverse=True)
+
+    @property
+    def steps(self) -> List:
+        """
+        Returns steps with recorded timings, in the order they were first run
+        """
+        with self._lock:
+            steps = dict.fromkeys(key[0] for key in self.timings)
+
+        return [step for step in steps if step is not None]
+
+    def report(self, step=ALL_STEPS) -> Dict[str, dict]:
+        """
+        Returns timings and counts per stage, with a per host breakdown
+
+        Covers every step by default, or only the given step.
+        """
+        result = {}
+
+        with self._lock:
+            for key, seconds in self.timings.items():
+                key_step, name, host_id = key
+                if step is not ALL_STEPS and key_step != step:
+                    continue
+
+                stage = result.setdefault(
+                    name, {"seconds": 0.0, "count": 0, "hosts": {}}
+                )
+                count = self.counts[key]
+
+                stage["seconds"] += seconds
+                stage["count"] += count
+                if host_id is not None:
+                    host = stage["hosts"].setdefault(
+                        host_id, {"seconds": 0.0, "count": 0}
+                    )
+                    host["seconds"] += seconds
+                    host["count"] += count
+
+        return result
+
+    def log_report(self, step=ALL_STEPS):
+        """
+        Logs stage timings of one step, or of every step followed by the slowest threads
+        """
+        prefix = "" if step is ALL_STEPS else f"step {step} "
+        for name, stage in self.report(step).items():
+            logger.info(
+                "%sstage %s: %.4fs over %d calls",
+                prefix,
+                name,
+                stage["seconds"],
+                stage["count"],
+            )
+
+        if step is ALL_STEPS:
+            self.log_slow_threads()
+
+    def log_slow_threads(self):
+        for seconds, host_id, guest_id in self.slow_threads:
+            logger.info("slow thread %s#%s: %.4fs", host_id, guest_id, seconds)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _charge(self, frame, now):
+        with self._lock:
+            self.timings[frame[0]] += now - frame[1]
+        frame[1] = now
@@ -0,0 +1,187 @@
+from typing import Callable, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+import bisect
+import hashlib
+import logging
+
+from db import DBAbstract
+from models import MessageModel, GuestModel
+
+logger = logging.getLogger()
+
+
+class HashRing:
+    """
+    Consistent hashing of host ids onto shard names
+
+    Each shard owns vnodes points on the ring, so adding a shard only moves
+    roughly 1/N of the hosts, all of them onto the new shard.
+    """
+
+    def __init__(self, shards: List[str] = (), vnodes: int = 100):
+        self.vnodes = vnodes
+        self._points = []  # sorted (position, shard)
+        for shard in shards:
+            self.add(shard)
+
+    @property
+    def shards(self) -> List[str]:
+        return sorted({shard for _, shard in self._points})
+
+    def add(self, shard: str):
+        for i in range(self.vnodes):
+            bisect.insort(self._points, (self._hash(f"{shard}#{i}"), shard))
+
+    def remove(self, shard: str):
+        self._points = [point for point in self._points if point[1] != shard]
+
+    def get(self, host_id: str) -> str:
+        if not self._points:
+            raise LookupError("hash ring has no shards")
+
+        index = bisect.bisect(self._points, (self._hash(host_id), ""))
+        return self._points[index % len(self._points)][1]
+
+    def copy(self) -> "HashRing":
+        ring = HashRing(vnodes=self.vnodes)
+        ring._points = list(self._points)
+        return ring
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class DBSharded(DBAbstract):
+    """
+    Implementation of database routing each host to one of several backends
+
+    Shards can be separate tables (DBDynamo("table_1"), ...) or partition key
+    shards of one table (DBDynamo(table=table, shard=1), ...). The global
+    messages / guests views fan out to all shards concurrently.
+    """
+
+    def __init__(self, shards: Dict[str, DBAbstract], vnodes: int = 100):
+        self.shards = dict(shards)
+        self.ring = HashRing(list(self.shards), vnodes)
+
+    @property
+    def messages(self):
+        return self._fan_out(lambda db: db.messages)
+
+    @property
+    def guests(self):
+        return self._fan_out(lambda db: db.guests)
+
+    def shard_for(self, host_id: str) -> DBAbstract:
+        return self.shards[self.ring.get(host_id)]
+
+    def messages_by_host_guest(self, host_id: str, guest_id: str):
+        return self.shard_for(host_id).messages_by_host_guest(host_id, guest_id)
+
+    def guests_by_host(self, host_id: str):
+        return self.shard_for(host_id).guests_by_host(host_id)
+
+    def add_guest(self, host_id: str, guest: GuestModel):
+        self.shard_for(host_id).add_guest(host_id, guest)
+
+    def add_message(self, host_id: str, message: MessageModel):
+        self.shard_for(host_id).add_message(host_id, message)
+
+    def add_messages(self, host_id: str, messages: List[MessageModel]):
+        self.shard_for(host_id).add_messages(host_id, messages)
+
+    def update_guest_stat(
+        self,
+        host_id: str,
+        guest_id: str,
+        old_updated_at: int,
+        new_updated_at: int,
+        new_total_messages: int,
+    ):
+        self.shard_for(host_id).update_guest_stat(
+            host_id, guest_id, old_updated_at, new_updated_at, new_total_messages
+        )
+
+    def recent_messages(self, host_id: str, since: int = 0, limit: int = None):
+        return self.shard_for(host_id).recent_messages(host_id, since, limit)
+
+    def on_commit(self, host_id: str, callback: Callable[[], None]):
+        self.shard_for(host_id).on_commit(host_id, callback)
+
+    def flush(self):
+        for db in self.shards.values():
+            db.flush()
+
+    def drop_host(self, host_id: str):
+        self.shard_for(host_id).drop_host(host_id)
+
+    def add_shard(self, name: str, db: DBAbstract) -> List[str]:
+        """
+        Adds a shard and moves the hosts it now owns onto it, returns moved host ids
+        """
+        ring = self.ring.copy()
+        ring.add(name)
+        self.shards[name] = db
+
+        return rebalance(self, ring)
+
+    def _fan_out(self, read) -> dict:
+        names = list(self.shards)
+        with ThreadPoolExecutor(max_workers=len(names) or 1) as executor:
+            results = executor.map(lambda name: read(self.shards[name]), names)
+
+            merged = {}
+            for name, result in zip(names, results):
+                # mid-rebalance a host can be on two shards, only its owner counts
+                merged.update(
+                    (host_id, data)
+                    for host_id, data in result.items()
+                    if self.ring.get(host_id) == name
+                )
+
+        return merged
+
+
+def rebalance(sharded: DBSharded, ring: HashRing) -> List[str]:
+    """
+    Moves every host whose owner differs under ring, then switches sharded over to ring
+
+    A host is copied to its new shard before being dropped from the old one,
+    and reads keep going to the old shard until the switch, so it stays
+    readable throughout. Writes to moving hosts should be paused meanwhile.
+    Returns moved host ids.
+    """
+    moves = []
+    for name, db in sharded.shards.items():
+        messages = db.messages
+        hosts = set(db.guests) | set(messages)
+        moves.extend(
+            # conversations are kept too, a host's messages may lack a guest row
+            (host_id, name, ring.get(host_id), set(messages.get(host_id, {})))
+            for host_id in sorted(hosts)
+            if ring.get(host_id) != name
+        )
+
+    for host_id, source_name, target_name, conversations in moves:
+        source, target = sharded.shards[source_name], sharded.shards[target_name]
+
+        guests = source.guests_by_host(host_id)
+        for guest in guests:
+            target.add_guest(host_id, guest)
+
+        guest_ids = conversations | {guest.guest_id for guest in guests}
+        for guest_id in sorted(guest_ids):
+            messages = source.messages_by_host_guest(host_id, guest_id)
+            if messages:
+                target.add_messages(host_id, messages[::-1])
+
+        target.flush()
+        logger.info("moved host %s from %s to %s", host_id, source_name, target_name)
+
+    sharded.ring = ring
+
+    for host_id, source_name, _, _ in moves:
+        sharded.shards[source_name].drop_host(host_id)
+
+    return [host_id for host_id, _, _, _ in moves]
@@ -1,9 +1,22 @@
 from typing import List
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+import argparse
+import gc
 import json
 import logging
+import pickle
+import tempfile
 
-from models import MessageModel, GuestModel, AirbnbThread
-from db import DBAbstract, DBObject, DBDynamo
+from models import MessageModel, GuestModel, AirbnbThread, ChangeEvent
+from db import DBAbstract, DBObject, DBDynamo, DBBatched
+from bloom import BloomFilter, message_key
+from normalize import normalize_thread, normalize_threads, RecordThread
+from profiling import NullProfiler, SyncProfiler
+from events import EventBus
+import utils
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -21,19 +34,201 @@ class AirbnbClient:
             return [AirbnbThread(thread) for thread in json.load(file)]
 
 
+class ChannelAdapter(ABC):
+    """
+    Retrieves threads of a single messaging channel
+
+    Threads have to expose the same accessors as AirbnbThread (guest_id, host_id,
+    updated_at, guest_name, messages), and their messages the same accessors as
+    AirbnbMessage (message, sent, user_id).
+
+    Adapters whose threads wrap a raw payload can set normalizer, a picklable
+    function turning one payload into a ThreadRecord (see normalize.py), so
+    SyncEngine can parse their threads in its executor. Without one, threads
+    are read through their accessors.
+    """
+
+    channel: str
+    normalizer = None
+
+    @abstractmethod
+    def get_messages(self, step=1) -> List:
+        pass
+
+
+class AirbnbAdapter(ChannelAdapter):
+    """plugs AirbnbClient into SyncEngine"""
+
+    channel = "airbnb"
+    normalizer = staticmethod(normalize_thread)
+
+    def __init__(self, client=None):
+        self.client = client or AirbnbClient()
+
+    def get_messages(self, step=1):
+        return self.client.get_messages(step)
+
+
 class SyncAirbnb:
     """syncs airbnb threads with enso database"""
 
-    def __init__(self, client, db: DBAbstract):
+    def __init__(
+        self,
+        client,
+        db: DBAbstract,
+        bloom: BloomFilter = None,
+        channel: str = "airbnb",
+        executor: Executor = None,
+        profiler: NullProfiler = None,
+        events: EventBus = None,
+        chunk_size: int = None,
+        rss_limit_mb: float = None,
+        normalizer=normalize_thread,
+    ):
         self.db = db
         self.client = client
+        # optional pre-check: a definite miss of a synced filter means message is new,
+        # so database read is skipped
+        self.bloom = bloom
+        self.channel = channel
+        # optional process pool, parsing is moved off the main process
+        # by normalizer, which has to understand the client's raw thread payloads
+        self.executor = executor
+        self.normalizer = normalizer
+        # pass a SyncProfiler to collect stage timings, default hooks are no-ops
+        self.profiler = profiler or NullProfiler()
+        # optional stream of created messages & guest updates for downstream consumers
+        self.events = events
+        # memory budget: threads are synced in host-grouped chunks, and pending
+        # chunks are spilled to a temp file once RSS goes above rss_limit_mb
+        self.chunk_size = chunk_size
+        self.rss_limit_mb = rss_limit_mb
+        self.peak_rss_mb = None
 
     def __call__(self, step):
-        airbnb_threads = self.client.get_messages(step)
-        for thread in airbnb_threads:
-            self._update_guest(thread)
-            for msg in thread.messages():
-                self._update_message(str(thread.guest_id()), str(thread.host_id()), msg)
+        with self.profiler.run(step):
+            self._sync_threads(self._fetch(step))
+
+        if self._chunked:
+            logger.info("step %s: peak RSS %.1f MB", step, self.peak_rss_mb)
+
+    @property
+    def _chunked(self):
+        return self.chunk_size is not None or self.rss_limit_mb is not None
+
+    def _fetch(self, step):
+        with self.profiler.stage("fetch"):
+            return self.client.get_messages(step)
+
+    def _sync_threads(self, threads):
+        if self._chunked:
+            self._sync_chunked(threads)
+        else:
+            self._sync_chunk(threads)
+
+    def _sync_chunked(self, threads):
+        """
+        Syncs threads chunk by chunk, committing & releasing each chunk before the next
+
+        Consumes threads: the list is emptied so synced threads can be garbage collected.
+        """
+        pending = deque(self._host_chunks(threads, self.chunk_size or 1000))
+        threads.clear()
+        spill = None
+        # ru_maxrss is the peak of the whole process, the step's peak is sampled instead
+        peak_rss_mb = utils.current_rss_mb()
+
+        try:
+            while pending or spill:
+                if pending:
+                    chunk = pending.popleft()
+                else:
+                    chunk = self._load_spilled(spill)
+                    if chunk is None:
+                        break
+
+                self._sync_chunk(chunk)
+                self.db.flush()
+                rss_mb = utils.current_rss_mb()
+                peak_rss_mb = max(peak_rss_mb, rss_mb)
+                del chunk
+
+                if (
+                    pending
+                    and self.rss_limit_mb is not None
+                    and rss_mb > self.rss_limit_mb
+                ):
+                    # pending is empty from here on, remaining chunks are read back from disk
+                    spill = tempfile.TemporaryFile()
+                    self._spill(pending, spill)
+                    gc.collect()
+        finally:
+            self.peak_rss_mb = peak_rss_mb
+            if spill:
+                spill.close()
+
+    def _host_chunks(self, threads, chunk_size):
+        """
+        Groups threads by host into chunks of up to chunk_size threads
+
+        A host is only split across chunks when it has more than chunk_size threads.
+        """
+        hosts = {}
+        for thread in threads:
+            hosts.setdefault(str(thread.host_id()), []).append(thread)
+
+        chunks, chunk = [], []
+        for host_threads in hosts.values():
+            if chunk and len(chunk) + len(host_threads) > chunk_size:
+                chunks.append(chunk)
+                chunk = []
+
+            for thread in host_threads:
+                if len(chunk) >= chunk_size:
+                    chunks.append(chunk)
+                    chunk = []
+                chunk.append(thread)
+
+        if chunk:
+            chunks.append(chunk)
+
+        return chunks
+
+    def _spill(self, pending, file):
+        count = len(pending)
+        while pending:
+            pickle.dump(pending.popleft(), file, pickle.HIGHEST_PROTOCOL)
+
+        file.seek(0)
+        logger.info("spilled %d chunks to disk", count)
+
+    def _load_spilled(self, file):
+        try:
+            return pickle.load(file)
+        except EOFError:
+            return None
+
+    def _sync_chunk(self, threads):
+        profiler = self.profiler
+
+        if self.executor is not None and self.normalizer is not None:
+            with profiler.stage("parse"):
+                threads = normalize_threads(
+                    threads, self.executor, normalizer=self.normalizer
+                )
+
+        for thread in threads:
+            with profiler.stage("parse"):
+                # accessors (ie. timestamp parsing) are resolved here, not during compare
+                thread = RecordThread.from_thread(thread)
+                guest_id = str(thread.guest_id())
+                host_id = str(thread.host_id())
+                messages = thread.messages()
+
+            with profiler.thread(host_id, guest_id), profiler.stage("compare", host_id):
+                self._update_guest(thread)
+                for msg in messages:
+                    self._update_message(guest_id, host_id, msg)
 
     @property
     def messages(self):
@@ -43,16 +238,27 @@ class SyncAirbnb:
     def guests(self):
         return self.db.guests
 
+    def recent_messages(self, host_id: str, since: int = 0, limit: int = None):
+        return self.db.recent_messages(host_id, since, limit)
+
     def _create_message(self, guest_id, host_id, message):
         user = "owner" if message.user_id() == host_id else "guest"
         new_msg = MessageModel(
             guest_id=guest_id,
             user=user,
             message=message.message(),
-            channel="airbnb",
+            channel=self.channel,
             sent=message.sent(),
         )
-        self.db.add_message(host_id, new_msg)
+        with self.profiler.stage("write", host_id):
+            self.db.add_message(host_id, new_msg)
+
+        if self.bloom is not None:
+            self.bloom.add(
+                message_key(host_id, guest_id, new_msg.sent, new_msg.message)
+            )
+
+        self._publish("message.created", host_id, new_msg)
 
     def _create_guest(self, thread):
         guest_id = str(thread.guest_id())
@@ -65,7 +271,10 @@ class SyncAirbnb:
             total_msgs=len(thread.messages()),
         )
 
-        self.db.add_guest(host_id, new_guest)
+        with self.profiler.stage("write", host_id):
+            self.db.add_guest(host_id, new_guest)
+
+        self._publish("guest.created", host_id, new_guest)
 
     def _update_guest(self, thread):
         guest_id = str(thread.guest_id())
@@ -86,15 +295,33 @@ class SyncAirbnb:
             or len(thread.messages()) != guest.total_msgs
         ):
             # update stat only if there are new messages
-            self.db.update_guest_stat(
+            with self.profiler.stage("write", host_id):
+                self.db.update_guest_stat(
+                    host_id,
+                    guest_id,
+                    guest.updated_at,
+                    thread.updated_at(),
+                    len(thread.messages()),
+                )
+
+            self._publish(
+                "guest.updated",
                 host_id,
-                guest_id,
-                guest.updated_at,
-                thread.updated_at(),
-                len(thread.messages()),
+                guest.copy(
+                    update={
+                        "updated_at": thread.updated_at(),
+                        "total_msgs": len(thread.messages()),
+                    }
+                ),
             )
 
     def _update_message(self, guest_id, host_id, message):
+        if self.bloom is not None and self.bloom.synced:
+            key = message_key(host_id, guest_id, message.sent(), message.message())
+            if key not in self.bloom:
+                self._create_message(guest_id, host_id, message)
+                return
+
         messages = self.db.messages_by_host_guest(host_id, guest_id)
 
         if not messages:
@@ -110,3 +337,130 @@ class SyncAirbnb:
 
         if current_hash not in messages_hash:
             self._create_message(guest_id, host_id, message)
+
+    def _publish(self, kind, host_id, model):
+        if self.events is None:
+            return
+
+        event = ChangeEvent(
+            kind=kind, host_id=host_id, guest_id=model.guest_id, data=model.dict()
+        )
+        # buffered writes (ie. DBBatched) are only published once committed
+        self.db.on_commit(host_id, partial(self.events.publish, event))
+
+
+class SyncEngine:
+    """
+    syncs several channels with enso database
+
+    Channels are polled concurrently, and all of their writes go through one
+    shared DBBatched pipeline which deduplicates and commits them in batches.
+    """
+
+    def __init__(
+        self,
+        adapters: List[ChannelAdapter],
+        db: DBAbstract,
+        batch_size: int = 100,
+        bloom: BloomFilter = None,
+        executor: Executor = None,
+        profiler: NullProfiler = None,
+        events: EventBus = None,
+    ):
+        # pass in an existing DBBatched to share one pipeline between engines
+        self.db = db if isinstance(db, DBBatched) else DBBatched(db, batch_size)
+        self.adapters = adapters
+        self.profiler = profiler or NullProfiler()
+        self.syncs = []
+        for adapter in adapters:
+            # only adapters with a raw payload normalizer are parsed in the executor
+            normalizer = getattr(adapter, "normalizer", None)
+            self.syncs.append(
+                SyncAirbnb(
+                    adapter,
+                    self.db,
+                    bloom=bloom,
+                    channel=adapter.channel,
+                    executor=executor if normalizer is not None else None,
+                    profiler=self.profiler,
+                    events=events,
+                    normalizer=normalizer,
+                )
+            )
+
+    def __call__(self, step):
+        with self.profiler.run(step):
+            with ThreadPoolExecutor(max_workers=max(len(self.adapters), 1)) as executor:
+                futures = [executor.submit(sync._fetch, step) for sync in self.syncs]
+
+                # compare runs in this thread, one channel at a time, while slower channels are still polling
+                for sync, future in zip(self.syncs, futures):
+                    sync._sync_threads(future.result())
+
+            with self.profiler.stage("write"):
+                self.db.flush()
+
+    @property
+    def messages(self):
+        return self.db.messages
+
+    @property
+    def guests(self):
+        return self.db.guests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="syncs airbnb threads with enso database"
+    )
+    parser.add_argument("steps", nargs="*", type=int, default=[1, 2])
+    parser.add_argument(
+        "--timings", action="store_true", help="log stage timings per step and per host"
+    )
+    parser.add_argument(
+        "--profile-dir", help="write a cProfile file per sync run into this directory"
+    )
+    parser.add_argument(
+        "--slow-threads",
+        type=int,
+        default=10,
+        help="number of slowest threads to log with --timings",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="sync threads in host-grouped chunks of this size",
+    )
+    parser.add_argument(
+        "--rss-limit-mb",
+        type=float,
+        help="spill pending chunks to a temp file once RSS goes above this",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig()
+
+    profiler = None
+    if args.timings or args.profile_dir:
+        profiler = SyncProfiler(args.profile_dir, args.slow_threads)
+
+    sync = SyncAirbnb(
+        AirbnbClient(),
+        DBObject(),
+        profiler=profiler,
+        chunk_size=args.chunk_size,
+        rss_limit_mb=args.rss_limit_mb,
+    )
+    for step in args.steps:
+        sync(step)
+        if profiler:
+            profiler.log_report(step)
+
+    if profiler:
+        profiler.log_slow_threads()
+
+    return sync
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import json
+import os
+import pytest
+from unittest.mock import Mock
+
+from bloom import BloomFilter, message_key
+from models import MessageModel, AirbnbThread
+from sync import SyncAirbnb
+from db import DBObject
+
+
+def load_threads(step):
+    path = os.path.join(os.path.dirname(__file__), f"threads_{step}.json")
+    with open(path) as file:
+        return [AirbnbThread(thread) for thread in json.load(file)]
+
+
+@pytest.mark.bloom
+def test_bloom_no_false_negatives():
+    bloom = BloomFilter(capacity=1_000, error_rate=0.01)
+    keys = [f"001#002#{i}#message {i}" for i in range(1_000)]
+    bloom.update(keys)
+
+    assert all(key in bloom for key in keys)
+
+
+@pytest.mark.bloom
+def test_bloom_false_positive_rate():
+    bloom = BloomFilter(capacity=1_000, error_rate=0.01)
+    bloom.update(f"present {i}" for i in range(1_000))
+
+    false_positives = sum(f"absent {i}" in bloom for i in range(10_000))
+
+    assert false_positives / 10_000 < 0.03
+    assert bloom.false_positive_rate == pytest.approx(0.01, rel=0.5)
+    assert bloom.metrics["memory_bytes"] == bloom.memory_bytes > 0
+
+
+@pytest.mark.bloom
+def test_bloom_save_load(tmp_path):
+    bloom = BloomFilter(capacity=100)
+    bloom.add("001#002#1000#guest message 1")
+    bloom.save(tmp_path / "bloom.bin")
+
+    loaded = BloomFilter.load(tmp_path / "bloom.bin")
+
+    assert not (loaded.synced)
+    assert "001#002#1000#guest message 1" in loaded
+    assert loaded.metrics == bloom.metrics
+
+
+@pytest.mark.bloom
+def test_bloom_from_messages():
+    message = MessageModel(
+        guest_id="002", sent=1000, message="hi", user="guest", channel="airbnb"
+    )
+    bloom = BloomFilter.from_messages({"001": {"002": [message]}})
+
+    assert message_key("001", "002", 1000, "hi") in bloom
+    assert message_key("001", "002", 1100, "hi") not in bloom
+
+
+@pytest.mark.bloom
+def test_update_message_bloom_miss_skips_read(sync, mock_message_one):
+    sync.bloom = BloomFilter(capacity=100)
+    sync.bloom.synced = True
+    sync._update_message("002", "001", mock_message_one)
+
+    assert not (sync.db.messages_by_host_guest.called)
+    sync.db.add_message.assert_called_once()
+    assert message_key("001", "002", 1000, "guest message 1") in sync.bloom
+
+
+@pytest.mark.bloom
+def test_update_message_bloom_hit_reads_db(sync, mock_message_one):
+    sync.bloom = BloomFilter(capacity=100)
+    sync.bloom.synced = True
+    sync.bloom.add(message_key("001", "002", 1000, "guest message 1"))
+    sync._update_message("002", "001", mock_message_one)
+
+    sync.db.messages_by_host_guest.assert_called_once_with("001", "002")
+
+
+@pytest.mark.bloom
+def test_unsynced_bloom_falls_back_to_read(sync, mock_message_one):
+    sync.bloom = BloomFilter(capacity=100)
+    sync._update_message("002", "001", mock_message_one)
+
+    sync.db.messages_by_host_guest.assert_called_once_with("001", "002")
+
+
+@pytest.mark.bloom
+def test_unsynced_bloom_does_not_duplicate(mock_client):
+    db = DBObject()
+    SyncAirbnb(mock_client, db)(1)
+    messages = db.messages
+
+    SyncAirbnb(mock_client, db, bloom=BloomFilter(capacity=100))(1)
+
+    assert db.messages == messages
+
+
+@pytest.mark.bloom
+def test_bloom_save_load_keeps_synced(tmp_path):
+    bloom = BloomFilter.from_messages({})
+    bloom.save(tmp_path / "bloom.bin")
+
+    assert BloomFilter.load(tmp_path / "bloom.bin").synced
+
+
+@pytest.mark.bloom
+def test_unsynced_bloom_stays_unsynced_after_reload(tmp_path):
+    client = Mock()
+    client.get_messages.side_effect = load_threads
+    db = DBObject()
+    SyncAirbnb(client, db)(1)
+
+    bloom = BloomFilter(capacity=100)
+    SyncAirbnb(client, db, bloom=bloom)(2)
+    messages = db.messages
+    bloom.save(tmp_path / "bloom.bin")
+
+    SyncAirbnb(client, db, bloom=BloomFilter.load(tmp_path / "bloom.bin"))(2)
+
+    assert db.messages == messages
@@ -0,0 +1,53 @@
+import pytest
+
+from sync import SyncAirbnb
+from db import DBObject, DBDynamo, DBDynamoBucketed
+from bench_storage import CapacityTable, make_conversations, run_benchmark
+
+
+@pytest.mark.bucketing
+@pytest.mark.parametrize("compress", [False, True])
+def test_bucketed_sync_matches_object_db(mock_client, compress):
+    sync_one = SyncAirbnb(mock_client, DBObject())
+    sync_two = SyncAirbnb(
+        mock_client, DBDynamoBucketed(table=CapacityTable(), compress=compress)
+    )
+    for step in [1, 2, 3]:
+        sync_one(step)
+        sync_two(step)
+
+    assert len(sync_two.messages) & len(sync_two.guests)
+    assert sync_one.messages == sync_two.messages
+    assert sync_one.guests == sync_two.guests
+
+
+@pytest.mark.bucketing
+def test_bucketed_rolls_over_at_size_cap():
+    table = CapacityTable()
+    db = DBDynamoBucketed(table=table, max_bucket_bytes=1_000)
+    messages = make_conversations(1, 50)["00000"]
+
+    db.add_messages("001", messages[:25])
+    for message in messages[25:]:
+        db.add_message("001", message)
+
+    buckets = [
+        item for (item_type, _), item in table.items.items() if item_type == "conv"
+    ]
+    assert len(buckets) > 1
+    assert all(item["itemData"]["size"] <= 1_000 for item in buckets)
+    assert db.messages_by_host_guest("001", "00000") == messages[::-1]
+
+
+@pytest.mark.bucketing
+def test_bucketed_reads_fewer_units_than_per_item():
+    conversations = make_conversations(3, 100)
+
+    per_item = run_benchmark(DBDynamo(table=CapacityTable()), conversations)
+    bucketed = run_benchmark(
+        DBDynamoBucketed(table=CapacityTable(), compress=True), conversations
+    )
+
+    _, per_item_rcu, _, _ = per_item["read"]
+    _, bucketed_rcu, _, _ = bucketed["read"]
+    assert bucketed_rcu < per_item_rcu
@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import pytest
+from unittest.mock import Mock
+
+from sync import SyncAirbnb, main
+from models import AirbnbThread
+from db import DBObject
+import utils
+
+
+def load_threads(step):
+    path = os.path.join(os.path.dirname(__file__), f"threads_{step}.json")
+    with open(path) as file:
+        return [AirbnbThread(thread) for thread in json.load(file)]
+
+
+def make_thread(host_id):
+    thread = Mock(name=f"thread of {host_id}")
+    thread.host_id.return_value = host_id
+    return thread
+
+
+@pytest.mark.chunked
+def test_host_chunks(sync):
+    threads = [make_thread(host) for host in ["001", "002", "001", "003", "003"]]
+    chunks = sync._host_chunks(threads, 3)
+
+    assert [[t.host_id() for t in chunk] for chunk in chunks] == [
+        ["001", "001", "002"],
+        ["003", "003"],
+    ]
+
+
+@pytest.mark.chunked
+def test_host_chunks_splits_large_host(sync):
+    threads = [make_thread("001") for _ in range(5)]
+
+    assert [len(chunk) for chunk in sync._host_chunks(threads, 2)] == [2, 2, 1]
+
+
+@pytest.mark.chunked
+def test_chunked_sync_matches(mock_client):
+    sync_one = SyncAirbnb(mock_client, DBObject())
+    sync_two = SyncAirbnb(mock_client, DBObject(), chunk_size=1)
+    for step in [1, 3]:
+        sync_one(step)
+        sync_two(step)
+
+    assert len(sync_two.messages) & len(sync_two.guests)
+    assert sync_one.messages == sync_two.messages
+    assert sync_one.guests == sync_two.guests
+    assert sync_two.peak_rss_mb > 0
+
+
+@pytest.mark.chunked
+def test_chunked_sync_spills_over_rss_limit(caplog):
+    client = Mock()
+    client.get_messages.side_effect = load_threads
+
+    sync_one = SyncAirbnb(client, DBObject())
+    sync_two = SyncAirbnb(client, DBObject(), chunk_size=1, rss_limit_mb=0)
+    with caplog.at_level(logging.INFO):
+        for step in [1, 2]:
+            sync_one(step)
+            sync_two(step)
+
+    assert "spilled 1 chunks to disk" in caplog.text
+    assert sync_one.messages == sync_two.messages
+    assert sync_one.guests == sync_two.guests
+
+
+@pytest.mark.chunked
+def test_peak_rss_per_step(mock_client, monkeypatch):
+    # one thread per step: sampled when the step starts and after its chunk
+    samples = iter([100, 300, 50, 60])
+    monkeypatch.setattr(utils, "current_rss_mb", lambda: next(samples))
+
+    sync = SyncAirbnb(mock_client, DBObject(), chunk_size=1)
+    sync(1)
+    assert sync.peak_rss_mb == 300
+
+    sync(1)
+    assert sync.peak_rss_mb == 60
+
+
+@pytest.mark.chunked
+def test_main_chunked(monkeypatch):
+    monkeypatch.chdir(os.path.dirname(__file__))
+    sync = main(["1", "2", "--chunk-size", "1", "--rss-limit-mb", "0"])
+
+    assert sync.peak_rss_mb > 0
+    assert len(sync.messages)
@@ -0,0 +1,209 @@
+import sys
+import threading
+import time
+import pytest
+
+from sync import SyncAirbnb
+from models import MessageModel, GuestModel
+from db import DBObject, DBObjectConcurrent
+
+WRITERS = 16
+HOSTS = 8
+GUESTS = 5
+MESSAGES = 50
+
+
+def make_message(guest_id, i):
+    return MessageModel(
+        guest_id=guest_id,
+        sent=1000 + i,
+        message=f"message {i}",
+        user="guest",
+        channel="SMS",
+    )
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.concurrent_db
+def test_concurrent_writers_stress():
+    db = DBObjectConcurrent(stripes=4)
+    done = threading.Event()
+    reader_errors = []
+
+    def writer(n):
+        # every host is written by two writers, so every message is inserted twice
+        for host in [n % HOSTS, (n + 1) % HOSTS]:
+            host_id = f"host{host}"
+            for guest in range(GUESTS):
+                guest_id = f"guest{guest}"
+                db.add_guest(
+                    host_id,
+                    GuestModel(guest_id=guest_id, updated_at=0, total_msgs=0, name="G"),
+                )
+                for i in range(MESSAGES):
+                    db.add_message(host_id, make_message(guest_id, i))
+                db.update_guest_stat(host_id, guest_id, 0, n, MESSAGES)
+
+    def reader():
+        while not done.is_set():
+            try:
+                db.messages
+                db.guests
+                db.messages_by_host_guest("host0", "guest0")
+                db.guests_by_host("host0")
+            except Exception as e:
+                reader_errors.append(e)
+
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    run_threads([lambda n=n: writer(n) for n in range(WRITERS)])
+    done.set()
+    reader_thread.join()
+
+    messages = db.messages
+    assert not reader_errors
+    assert len(messages) == HOSTS
+    for conversations in messages.values():
+        assert len(conversations) == GUESTS
+        for conversation in conversations.values():
+            assert [msg.sent for msg in conversation] == list(
+                range(1000 + MESSAGES - 1, 999, -1)
+            )
+    assert all(
+        guest.total_msgs == MESSAGES
+        for guests in db.guests.values()
+        for guest in guests.values()
+    )
+
+
+@pytest.mark.concurrent_db
+def test_drop_host_while_adding_hosts():
+    db = DBObjectConcurrent(stripes=4)
+    done = threading.Event()
+    errors = []
+
+    def writer():
+        i = 0
+        while not done.is_set():
+            db.add_message(f"new{i}", make_message("guest0", 0))
+            i += 1
+
+    def dropper():
+        try:
+            for i in range(2000):
+                db.add_message("host0", make_message("guest0", i))
+                db.drop_host("host0")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    # switch threads often, so drop_host overlaps with hosts being added
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        run_threads([writer, dropper])
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert not errors
+    assert "host0" not in db.messages
+
+
+@pytest.mark.concurrent_db
+def test_add_message_if_absent():
+    db = DBObjectConcurrent()
+    message = make_message("guest0", 0)
+
+    assert db.add_message_if_absent("host0", message)
+    assert not db.add_message_if_absent("host0", message)
+    assert db.messages_by_host_guest("host0", "guest0") == [message]
+
+
+@pytest.mark.concurrent_db
+def test_add_guest_keeps_messages():
+    db = DBObjectConcurrent()
+    guest = GuestModel(guest_id="guest0", updated_at=0, total_msgs=1, name="G")
+    db.add_guest("host0", guest)
+    db.add_message("host0", make_message("guest0", 0))
+    db.add_guest("host0", guest)
+
+    assert len(db.messages_by_host_guest("host0", "guest0")) == 1
+
+
+@pytest.mark.concurrent_db
+def test_stripes_do_not_block_other_hosts():
+    db = DBObjectConcurrent(stripes=4)
+    other_host = next(
+        f"host{i}" for i in range(100) if db._lock(f"host{i}") is not db._lock("host0")
+    )
+
+    with db._lock("host0"):
+        blocked = threading.Thread(
+            target=db.add_message, args=("host0", make_message("guest0", 0))
+        )
+        free = threading.Thread(
+            target=db.add_message, args=(other_host, make_message("guest0", 0))
+        )
+        blocked.start()
+        free.start()
+
+        free.join(timeout=1)
+        blocked.join(timeout=0.1)
+        assert not free.is_alive()
+        assert blocked.is_alive()
+
+    blocked.join(timeout=1)
+    assert not blocked.is_alive()
+
+
+@pytest.mark.concurrent_db
+def test_parallel_syncs(mock_client):
+    expected = SyncAirbnb(mock_client, DBObject())
+    expected(3)
+
+    db = DBObjectConcurrent()
+    syncs = [SyncAirbnb(mock_client, db) for _ in range(8)]
+    run_threads([lambda sync=sync: sync(3) for sync in syncs])
+
+    assert db.messages == expected.messages
+
+
+class SlowIndexDB(DBObjectConcurrent):
+    """holds the stripe lock through a GIL-releasing pause, like a write-through to disk or network"""
+
+    def _index_message(self, host_id, message):
+        time.sleep(0.002)
+        super()._index_message(host_id, message)
+
+
+def write_throughput(db, writers, messages=10):
+    """returns messages written per second by writers threads, one host each"""
+
+    def writer(n):
+        for i in range(messages):
+            db.add_message(f"host{n}", make_message("guest0", i))
+
+    start = time.perf_counter()
+    run_threads([lambda n=n: writer(n) for n in range(writers)])
+
+    return writers * messages / (time.perf_counter() - start)
+
+
+@pytest.mark.concurrent_db
+def test_stripes_scale_writers():
+    # pure in-memory inserts are CPU bound and serialized by the GIL whatever the
+    # locking, stripes pay off once writers block while holding the lock
+    single_writer = write_throughput(SlowIndexDB(stripes=64), writers=1)
+    striped = write_throughput(SlowIndexDB(stripes=64), writers=8)
+    single_lock = write_throughput(SlowIndexDB(stripes=1), writers=8)
+
+    assert striped > 2 * single_writer
+    assert striped > 2 * single_lock
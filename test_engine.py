@@ -0,0 +1,115 @@
+import pytest
+from unittest.mock import Mock
+
+from sync import SyncAirbnb, SyncEngine
+from models import MessageModel, GuestModel
+from db import DBObject, DBBatched
+
+
+def make_adapter(client, channel):
+    adapter = Mock(name=f"{channel} adapter")
+    adapter.channel = channel
+    adapter.get_messages.side_effect = client.get_messages.side_effect
+    return adapter
+
+
+@pytest.mark.engine
+def test_engine_matches_sync_airbnb(mock_client):
+    sync = SyncAirbnb(mock_client, DBObject())
+    sync(1)
+    sync(3)
+
+    engine = SyncEngine([make_adapter(mock_client, "airbnb")], DBObject())
+    engine(1)
+    engine(3)
+
+    assert len(engine.messages) & len(engine.guests)
+    assert engine.messages == sync.messages
+    assert engine.guests == sync.guests
+
+
+@pytest.mark.engine
+def test_engine_dedupes_across_channels(mock_client):
+    db = Mock(wraps=DBObject())
+    engine = SyncEngine(
+        [make_adapter(mock_client, "airbnb"), make_adapter(mock_client, "SMS")], db
+    )
+    engine(2)
+
+    # both channels report the same thread, each message is written once
+    assert db.add_guest.call_count == 1
+    assert len(db.messages_by_host_guest("001", "002")) == 3
+    db.add_messages.assert_called_once()
+
+
+@pytest.mark.engine
+def test_batched_reads_see_pending_writes():
+    db = Mock(wraps=DBObject())
+    batched = DBBatched(db)
+    guest = GuestModel(guest_id="002", updated_at=1000, total_msgs=1, name="Guest")
+    message = MessageModel(
+        guest_id="002", sent=1000, message="hi", user="guest", channel="SMS"
+    )
+
+    batched.add_guest("001", guest)
+    batched.add_message("001", message)
+    batched.update_guest_stat("001", "002", 1000, 1100, 2)
+
+    assert batched.guests_by_host("001")[0].updated_at == 1100
+    assert batched.messages_by_host_guest("001", "002") == [message]
+    assert not (db.add_guest.called)
+
+    batched.flush()
+
+    assert db.guests_by_host("001")[0].updated_at == 1100
+    assert db.messages_by_host_guest("001", "002") == [message]
+    assert not (db.update_guest_stat.called)
+
+
+@pytest.mark.engine
+def test_batched_flushes_at_batch_size():
+    db = Mock(wraps=DBObject())
+    batched = DBBatched(db, batch_size=2)
+    guest = GuestModel(guest_id="002", updated_at=1000, total_msgs=1, name="Guest")
+    message = MessageModel(
+        guest_id="002", sent=1000, message="hi", user="guest", channel="SMS"
+    )
+
+    batched.add_guest("001", guest)
+    assert not (db.add_guest.called)
+
+    batched.add_message("001", message)
+    db.add_guest.assert_called_once_with("001", guest)
+    db.add_messages.assert_called_once_with("001", [message])
+
+
+@pytest.mark.engine
+def test_batched_failed_flush_keeps_uncommitted_writes():
+    db = DBObject()
+    batched = DBBatched(db)
+    guest = GuestModel(guest_id="002", updated_at=1000, total_msgs=1, name="Guest")
+    message = MessageModel(
+        guest_id="002", sent=1000, message="hi", user="guest", channel="SMS"
+    )
+    committed = []
+
+    batched.add_guest("001", guest)
+    batched.add_message("001", message)
+    batched.on_commit("001", lambda: committed.append(True))
+
+    add_messages = db.add_messages
+    db.add_messages = Mock(side_effect=IOError("write failed"))
+    with pytest.raises(IOError):
+        batched.flush()
+
+    # guest made it, message is still buffered & readable, callback still waits
+    assert db.guests_by_host("001") == [guest]
+    assert db.messages_by_host_guest("001", "002") == []
+    assert batched.messages_by_host_guest("001", "002") == [message]
+    assert not (committed)
+
+    db.add_messages = add_messages
+    batched.flush()
+
+    assert db.messages_by_host_guest("001", "002") == [message]
+    assert committed == [True]
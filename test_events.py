@@ -0,0 +1,184 @@
+import asyncio
+import os
+import subprocess
+import sys
+import pytest
+from unittest.mock import Mock
+
+from sync import SyncAirbnb
+from models import ChangeEvent
+from events import ChangeLog, EventBus
+from db import DBObject, DBBatched
+
+
+def make_event(guest_id="002"):
+    return ChangeEvent(kind="guest.created", host_id="001", guest_id=guest_id, data={})
+
+
+@pytest.mark.events
+def test_sync_publishes_changes(mock_client):
+    bus = EventBus()
+    subscription = bus.subscribe()
+    sync = SyncAirbnb(mock_client, DBObject(), events=bus)
+    sync(1)
+    sync(3)
+
+    events = subscription.get_batch(timeout=0)
+
+    assert [event.kind for event in events] == [
+        "guest.created",
+        "message.created",
+        "guest.updated",
+        "message.created",
+        "message.created",
+        "guest.created",
+        "message.created",
+    ]
+    assert events[2].data["total_msgs"] == 3
+    assert subscription.get_batch(timeout=0) == []
+
+
+@pytest.mark.events
+def test_buffered_changes_published_on_commit(mock_client):
+    bus = EventBus()
+    subscription = bus.subscribe()
+    db = DBObject()
+    sync = SyncAirbnb(mock_client, DBBatched(db, batch_size=1000), events=bus)
+    sync(1)
+
+    assert subscription.get_batch(timeout=0) == []
+
+    sync.db.flush()
+    events = subscription.get_batch(timeout=0)
+
+    assert [event.kind for event in events] == ["guest.created", "message.created"]
+    assert db.messages_by_host_guest("001", events[1].guest_id)
+
+
+@pytest.mark.events
+def test_failed_flush_publishes_nothing(mock_client):
+    bus = EventBus()
+    subscription = bus.subscribe()
+    db = DBObject()
+    db.add_messages = Mock(side_effect=IOError("write failed"))
+    sync = SyncAirbnb(mock_client, DBBatched(db, batch_size=1000), events=bus)
+    sync(1)
+
+    with pytest.raises(IOError):
+        sync.db.flush()
+
+    assert subscription.get_batch(timeout=0) == []
+
+
+@pytest.mark.events
+def test_subscription_batches():
+    bus = EventBus()
+    subscription = bus.subscribe(batch_size=2)
+    for guest_id in ["002", "003", "004"]:
+        bus.publish(make_event(guest_id))
+
+    assert [e.guest_id for e in subscription.get_batch()] == ["002", "003"]
+    assert [e.guest_id for e in subscription.get_batch()] == ["004"]
+
+
+@pytest.mark.events
+def test_subscription_backpressure():
+    bus = EventBus(publish_timeout=0.01)
+    subscription = bus.subscribe(maxsize=1)
+    bus.publish(make_event())
+
+    # consumer stalled past publish_timeout, event is dropped, publisher goes on
+    bus.publish(make_event())
+    assert subscription.dropped == 1
+
+    dropping = bus.subscribe(maxsize=1, overflow="drop")
+    bus.unsubscribe(subscription)
+    bus.publish(make_event("003"))
+    bus.publish(make_event("004"))
+
+    assert dropping.dropped == 1
+    assert [e.guest_id for e in dropping.get_batch()] == ["004"]
+
+
+@pytest.mark.events
+def test_resume_from_change_log(tmp_path):
+    path = str(tmp_path / "changes.log")
+    bus = EventBus(ChangeLog(path))
+    subscription = bus.subscribe()
+    for guest_id in ["002", "003", "004"]:
+        bus.publish(make_event(guest_id))
+
+    assert len(subscription.get_batch(timeout=0)) == 3
+    assert subscription.offset == 2
+    bus.log.close()
+
+    # restarted consumer picks up after offset 0, then receives live events
+    bus = EventBus(ChangeLog(path))
+    subscription = bus.subscribe(from_offset=1)
+    bus.publish(make_event("005"))
+
+    events = subscription.get_batch() + subscription.get_batch(timeout=0)
+    assert [(e.offset, e.guest_id) for e in events] == [
+        (1, "003"),
+        (2, "004"),
+        (3, "005"),
+    ]
+
+
+@pytest.mark.events
+def test_async_consumer():
+    bus = EventBus()
+    subscription = bus.subscribe()
+
+    async def consume():
+        batches = []
+        async for batch in subscription:
+            batches.append(batch)
+        return batches
+
+    async def run():
+        task = asyncio.create_task(consume())
+        bus.publish(make_event())
+        await asyncio.sleep(0.05)
+        subscription.close()
+        return await task
+
+    batches = asyncio.run(run())
+
+    assert [e.guest_id for batch in batches for e in batch] == ["002"]
+
+
+CANCELLED_CONSUMER = """
+import asyncio
+from events import EventBus
+from test_events import make_event
+
+bus = EventBus()
+subscription = bus.subscribe()
+
+async def run():
+    task = asyncio.create_task(subscription.aget_batch())
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    bus.publish(make_event())
+
+asyncio.run(run())
+print(len(subscription.get_batch(timeout=0)))
+"""
+
+
+@pytest.mark.events
+def test_cancelled_async_consumer():
+    # a worker thread stuck in a blocking get would hang asyncio.run() at shutdown
+    result = subprocess.run(
+        [sys.executable, "-c", CANCELLED_CONSUMER],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=10,
+    )
+
+    # nothing was taken by the cancelled consumer
+    assert result.stdout.strip() == "1"
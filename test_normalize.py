@@ -0,0 +1,105 @@
+import json
+import os
+import pytest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest.mock import Mock
+
+from sync import SyncAirbnb, SyncEngine, AirbnbAdapter, ChannelAdapter
+from models import AirbnbThread
+from normalize import normalize_thread, normalize_threads, RecordThread
+from db import DBObject
+
+
+def load_threads(step):
+    path = os.path.join(os.path.dirname(__file__), f"threads_{step}.json")
+    with open(path) as file:
+        return [AirbnbThread(thread) for thread in json.load(file)]
+
+
+@pytest.fixture
+def airbnb_client():
+    client = Mock()
+    client.get_messages.side_effect = load_threads
+    return client
+
+
+@pytest.mark.normalize
+def test_normalized_records_match_threads():
+    threads = load_threads(2)
+
+    for thread, record in zip(threads, normalize_threads(threads)):
+        assert record.guest_id() == thread.guest_id()
+        assert record.host_id() == thread.host_id()
+        assert record.updated_at() == thread.updated_at()
+        assert record.guest_name() == thread.guest_name()
+        assert [(m.message(), m.sent(), m.user_id()) for m in record.messages()] == [
+            (m.message(), m.sent(), m.user_id()) for m in thread.messages()
+        ]
+
+
+@pytest.mark.normalize
+def test_normalize_malformed_thread():
+    with pytest.raises(ValueError):
+        normalize_thread({"id": 1, "attachment": {"roles": []}})
+
+
+@pytest.mark.normalize
+def test_normalize_thread_without_payload():
+    thread = RecordThread((1, 2, 1000, "Guest", ()))
+
+    with pytest.raises(ValueError, match="malformed thread"):
+        normalize_thread(thread)
+
+
+@pytest.mark.normalize
+def test_normalize_process_pool():
+    threads = load_threads(2)
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        records = normalize_threads(threads, executor, chunksize=1)
+
+    assert [r.record for r in records] == [r.record for r in normalize_threads(threads)]
+
+
+@pytest.mark.normalize
+def test_sync_with_process_pool(airbnb_client):
+    sync_one = SyncAirbnb(airbnb_client, DBObject())
+    sync_one(1)
+    sync_one(2)
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        sync_two = SyncAirbnb(airbnb_client, DBObject(), executor=executor)
+        sync_two(1)
+        sync_two(2)
+
+    assert len(sync_one.messages) & len(sync_two.messages)
+    assert sync_one.messages == sync_two.messages
+    assert sync_one.guests == sync_two.guests
+
+
+class SMSAdapter(ChannelAdapter):
+    """threads only expose accessors, there is no raw payload to normalize"""
+
+    channel = "SMS"
+
+    def get_messages(self, step=1):
+        return [
+            RecordThread(record.record)
+            for record in normalize_threads(load_threads(step))
+        ]
+
+
+@pytest.mark.normalize
+def test_engine_executor_skips_adapters_without_normalizer(airbnb_client):
+    adapters = [AirbnbAdapter(airbnb_client), SMSAdapter()]
+
+    engine_one = SyncEngine(adapters, DBObject())
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        engine_two = SyncEngine(adapters, DBObject(), executor=executor)
+        for step in [1, 2]:
+            engine_one(step)
+            engine_two(step)
+
+    assert engine_two.syncs[1].executor is None
+    assert len(engine_one.messages) & len(engine_two.messages)
+    assert engine_one.messages == engine_two.messages
@@ -0,0 +1,106 @@
+import threading
+import pytest
+
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+import aws
+from aws import ClientPool
+from db import DBDynamo
+
+
+class FakeRaw:
+    def stream(self, **kwargs):
+        yield b"{}"
+
+
+@pytest.fixture
+def credentials(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "foo")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "bar")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    # DBDynamo only sets it when missing, so it doesn't leak past the test
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", "./credentials")
+
+
+def respond(pool, status=200, barrier=None):
+    """answers every request of pool's client locally, optionally once all parties arrive"""
+
+    def handler(request, **kwargs):
+        if barrier is not None:
+            barrier.wait(timeout=5)
+        return AWSResponse(request.url, status, {}, FakeRaw())
+
+    pool.client().meta.events.register("before-send.dynamodb", handler)
+
+
+@pytest.mark.pool
+def test_pool_shared_across_backends(credentials, monkeypatch):
+    monkeypatch.setattr(aws, "_pool", None)
+
+    one, two = DBDynamo("table_one"), DBDynamo("table_two")
+
+    assert one.pool is two.pool is aws.get_pool()
+    assert one.table.meta.client is two.table.meta.client
+
+
+@pytest.mark.pool
+def test_tables_per_thread_share_client(credentials):
+    pool = ClientPool()
+    table = pool.table("table")
+    tables = []
+
+    thread = threading.Thread(target=lambda: tables.append(table._table()))
+    thread.start()
+    thread.join()
+    tables.append(table._table())
+
+    assert tables[0] is not tables[1]
+    assert tables[0].meta.client is tables[1].meta.client is pool.client()
+
+
+@pytest.mark.pool
+def test_configure_pool(credentials, monkeypatch):
+    monkeypatch.setattr(aws, "_pool", None)
+
+    pool = aws.configure_pool(max_pool_connections=4, retry_mode="adaptive")
+    config = DBDynamo("table").table.meta.client.meta.config
+
+    assert aws.get_pool() is pool
+    assert config.max_pool_connections == 4
+    assert config.retries["mode"] == "adaptive"
+
+
+@pytest.mark.pool
+def test_pool_metrics(credentials):
+    pool = ClientPool(max_pool_connections=2, max_attempts=1)
+    respond(pool, barrier=threading.Barrier(4))
+    table = DBDynamo("table", pool=pool).table
+
+    threads = [
+        threading.Thread(target=table.get_item, kwargs={"Key": {"itemType": "x"}})
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    metrics = pool.metrics()
+    assert metrics["requests"] == 4
+    assert metrics["peak_in_flight"] == 4
+    assert metrics["saturated"] == 2
+    assert metrics["in_flight"] == 0
+    assert metrics["errors"] == 0
+
+
+@pytest.mark.pool
+def test_pool_counts_errors(credentials):
+    pool = ClientPool(max_attempts=1)
+    respond(pool, status=400)
+
+    with pytest.raises(ClientError):
+        pool.table("table").get_item(Key={"itemType": "x"})
+
+    assert pool.metrics()["errors"] == 1
+    assert pool.metrics()["in_flight"] == 0
@@ -0,0 +1,96 @@
+import os
+import pytest
+
+from sync import SyncAirbnb, main
+from profiling import NullProfiler, SyncProfiler
+from db import DBObject
+
+
+@pytest.mark.profiling
+def test_profiler_disabled_by_default(sync):
+    assert isinstance(sync.profiler, NullProfiler)
+    assert not (sync.profiler.enabled)
+
+
+@pytest.mark.profiling
+def test_profiler_stage_timings(mock_client):
+    profiler = SyncProfiler(slow_threads=1)
+    sync = SyncAirbnb(mock_client, DBObject(), profiler=profiler)
+    sync(1)
+    sync(3)
+
+    report = profiler.report()
+
+    assert set(report) == {"fetch", "parse", "compare", "write"}
+    assert report["fetch"]["count"] == 2
+    assert report["parse"]["count"] == 3
+    assert report["compare"]["hosts"]["001"]["count"] == 3
+    # step 1: guest 002 + 1 message, step 3: stat update + 2 messages, guest 003 + 1 message
+    assert report["write"]["hosts"]["001"]["count"] == 7
+    assert len(profiler.slow_threads) == 1
+
+
+@pytest.mark.profiling
+def test_profiler_timings_per_step(mock_client):
+    profiler = SyncProfiler()
+    sync = SyncAirbnb(mock_client, DBObject(), profiler=profiler)
+    sync(1)
+    sync(3)
+
+    assert profiler.steps == [1, 3]
+    assert profiler.report(1)["compare"]["count"] == 1
+    assert profiler.report(3)["compare"]["count"] == 2
+    assert profiler.report(1)["write"]["hosts"]["001"]["count"] == 2
+    assert profiler.report(3)["write"]["hosts"]["001"]["count"] == 5
+    assert profiler.step is None
+
+
+@pytest.mark.profiling
+def test_accessors_charged_to_parse(mock_client):
+    profiler = SyncProfiler()
+    stages = []
+
+    def timestamp():
+        # frames are [(step, stage, host_id), start]
+        stages.append(profiler._stack()[-1][0][1])
+        return 1000
+
+    thread = mock_client.get_messages(1)[0]
+    thread.messages.return_value[0].sent.side_effect = timestamp
+    thread.updated_at.side_effect = timestamp
+
+    SyncAirbnb(mock_client, DBObject(), profiler=profiler)._sync_threads([thread])
+
+    assert stages and set(stages) == {"parse"}
+
+
+@pytest.mark.profiling
+def test_profiler_nested_stages_are_exclusive():
+    profiler = SyncProfiler()
+
+    with profiler.stage("compare", "001"):
+        with profiler.stage("write", "001"):
+            pass
+
+    total = sum(profiler.timings.values())
+    assert profiler.timings[(None, "write", "001")] < total
+    assert profiler.counts[(None, "compare", "001")] == 1
+
+
+@pytest.mark.profiling
+def test_profiler_writes_profile_file(mock_client, tmp_path):
+    profiler = SyncProfiler(profile_dir=str(tmp_path))
+    sync = SyncAirbnb(mock_client, DBObject(), profiler=profiler)
+    sync(1)
+
+    assert len(profiler.profiles) == 1
+    assert os.path.getsize(profiler.profiles[0]) > 0
+
+
+@pytest.mark.profiling
+def test_main_with_timings(monkeypatch, tmp_path):
+    monkeypatch.chdir(os.path.dirname(__file__))
+    sync = main(["1", "--timings", "--profile-dir", str(tmp_path)])
+
+    assert len(sync.profiler.profiles) == 1
+    assert sync.profiler.report()["fetch"]["count"] == 1
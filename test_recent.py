@@ -0,0 +1,121 @@
+import pytest
+
+from models import MessageModel, GuestModel
+from db import DBObject, DBObjectConcurrent, DBDynamo, DBDynamoBucketed, DBBatched
+from sharding import DBSharded
+from bench_storage import CapacityTable
+
+
+def message(guest_id, sent, text=None):
+    return MessageModel(
+        guest_id=guest_id,
+        sent=sent,
+        message=text or f"{guest_id} {sent}",
+        user="guest",
+        channel="airbnb",
+    )
+
+
+BACKENDS = {
+    "object": DBObject,
+    "object_concurrent": DBObjectConcurrent,
+    "dynamo": lambda: DBDynamo(table=CapacityTable()),
+    "dynamo_bucketed": lambda: DBDynamoBucketed(table=CapacityTable()),
+    "sharded": lambda: DBSharded({"a": DBObject(), "b": DBObject()}),
+}
+
+
+def add_guests(db, host_id, *guest_ids):
+    for guest_id in guest_ids:
+        db.add_guest(
+            host_id, GuestModel(guest_id=guest_id, updated_at=0, total_msgs=0, name="G")
+        )
+
+
+def populate(db):
+    add_guests(db, "other", "004")
+    for guest_id, sents in {"001": [100, 400], "002": [200, 500], "003": [300]}.items():
+        add_guests(db, "host", guest_id)
+        db.add_messages("host", [message(guest_id, sent) for sent in sents])
+    db.add_message("other", message("004", 600))
+    db.flush()
+
+
+@pytest.mark.recent
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_recent_messages(backend):
+    db = BACKENDS[backend]()
+    populate(db)
+
+    assert [m.sent for m in db.recent_messages("host")] == [500, 400, 300, 200, 100]
+    assert [m.sent for m in db.recent_messages("host", since=300)] == [500, 400, 300]
+    assert [m.sent for m in db.recent_messages("host", limit=2)] == [500, 400]
+    assert [m.sent for m in db.recent_messages("host", 200, limit=10)] == [
+        500,
+        400,
+        300,
+        200,
+    ]
+    assert db.recent_messages("host", since=501) == []
+    assert db.recent_messages("host", limit=0) == []
+    assert db.recent_messages("nobody") == []
+
+
+@pytest.mark.recent
+@pytest.mark.parametrize("backend", ["object", "dynamo"])
+def test_recent_messages_same_timestamp(backend):
+    db = BACKENDS[backend]()
+    add_guests(db, "host", "001", "002")
+    db.add_message("host", message("001", 100, "a"))
+    db.add_message("host", message("002", 100, "b"))
+    db.add_message("host", message("001", 100, "c"))
+
+    assert sorted(m.message for m in db.recent_messages("host")) == ["a", "b", "c"]
+
+
+@pytest.mark.recent
+def test_recent_messages_dropped_with_host():
+    db = DBDynamo(table=CapacityTable())
+    populate(db)
+    db.drop_host("host")
+
+    assert db.recent_messages("host") == []
+    assert len(db.recent_messages("other")) == 1
+
+
+@pytest.mark.recent
+def test_recent_messages_merges_pending_writes():
+    db = DBBatched(DBObject(), batch_size=100)
+    add_guests(db, "host", "001", "002", "003")
+    db.add_message("host", message("001", 100))
+    db.add_message("host", message("002", 300))
+    db.flush()
+    db.add_message("host", message("001", 200))
+    db.add_message("host", message("003", 400))
+
+    assert [m.sent for m in db.recent_messages("host")] == [400, 300, 200, 100]
+    assert [m.sent for m in db.recent_messages("host", 150, limit=2)] == [400, 300]
+
+
+@pytest.mark.recent
+def test_recent_messages_single_range_read():
+    table = CapacityTable()
+    db = DBDynamo(table=table)
+    for guest in range(20):
+        db.add_messages("host", [message(f"{guest:03d}", 1000 + guest)])
+
+    table.reset()
+    assert len(db.recent_messages("host", limit=5)) == 5
+    assert table.requests == 1
+
+
+@pytest.mark.recent
+def test_recent_messages_reset_with_guest():
+    db = DBObject()
+    add_guests(db, "host", "001", "002")
+    db.add_message("host", message("001", 100))
+    db.add_message("host", message("002", 200))
+    add_guests(db, "host", "001")
+
+    assert db.messages_by_host_guest("host", "001") == []
+    assert [m.guest_id for m in db.recent_messages("host")] == ["002"]
@@ -0,0 +1,108 @@
+import pytest
+
+from sync import SyncAirbnb
+from models import MessageModel, GuestModel
+from db import DBObject, DBDynamo
+from sharding import DBSharded, HashRing
+from bench_storage import CapacityTable
+
+HOSTS = [f"host{i}" for i in range(60)]
+
+
+def populate(db):
+    for host_id in HOSTS:
+        db.add_guest(
+            host_id, GuestModel(guest_id="002", updated_at=1000, total_msgs=2, name="G")
+        )
+        for sent in [1000, 1100]:
+            db.add_message(
+                host_id,
+                MessageModel(
+                    guest_id="002",
+                    sent=sent,
+                    message=f"{host_id} {sent}",
+                    user="guest",
+                    channel="airbnb",
+                ),
+            )
+
+
+@pytest.mark.sharding
+def test_hash_ring_adding_shard_only_moves_to_new_shard():
+    ring = HashRing(["a", "b", "c"])
+    before = {host_id: ring.get(host_id) for host_id in HOSTS}
+    assert set(before.values()) == {"a", "b", "c"}
+
+    ring.add("d")
+    moved = [host_id for host_id in HOSTS if ring.get(host_id) != before[host_id]]
+
+    assert all(ring.get(host_id) == "d" for host_id in moved)
+    assert 0 < len(moved) < len(HOSTS) / 2
+
+
+@pytest.mark.sharding
+def test_sharded_sync_matches_object_db(mock_client):
+    sync_one = SyncAirbnb(mock_client, DBObject())
+    sync_two = SyncAirbnb(mock_client, DBSharded({"a": DBObject(), "b": DBObject()}))
+    for step in [1, 3]:
+        sync_one(step)
+        sync_two(step)
+
+    assert len(sync_two.messages) & len(sync_two.guests)
+    assert sync_one.messages == sync_two.messages
+    assert sync_one.guests == sync_two.guests
+
+
+@pytest.mark.sharding
+def test_partition_key_shards():
+    table = CapacityTable()
+    db = DBSharded({str(i): DBDynamo(table=table, shard=i) for i in range(4)})
+    populate(db)
+
+    partitions = {item_type for item_type, _ in table.items}
+    # guest, msg & recent partitions per shard
+    assert len(partitions) == 12
+    assert set(db.guests) == set(HOSTS)
+    assert db.messages_by_host_guest("host1", "002")[0].message == "host1 1100"
+
+
+@pytest.mark.sharding
+@pytest.mark.parametrize("backend", ["object", "dynamo"])
+def test_add_shard_rebalances(backend):
+    table = CapacityTable()
+    make_db = {
+        "object": lambda i: DBObject(),
+        "dynamo": lambda i: DBDynamo(table=table, shard=i),
+    }[backend]
+
+    db = DBSharded({"0": make_db(0), "1": make_db(1)})
+    populate(db)
+    messages, guests = db.messages, db.guests
+
+    moved = db.add_shard("2", make_db(2))
+
+    assert moved
+    assert set(db.shards["2"].guests) == set(moved)
+    assert not set(moved) & (set(db.shards["0"].guests) | set(db.shards["1"].guests))
+    assert db.messages == messages
+    assert db.guests == guests
+
+
+@pytest.mark.sharding
+def test_rebalance_moves_messages_without_guest():
+    table = CapacityTable()
+    db = DBSharded({"0": DBDynamo(table=table, shard=0)})
+    for host_id in HOSTS:
+        db.add_message(
+            host_id,
+            MessageModel(
+                guest_id="002", sent=1000, message="hi", user="guest", channel="airbnb"
+            ),
+        )
+    messages = db.messages
+
+    moved = db.add_shard("1", DBDynamo(table=table, shard=1))
+
+    assert moved
+    assert set(db.shards["1"].messages) == set(moved)
+    assert db.messages == messages
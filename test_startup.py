@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import pytest
+
+import db
+from db import DBObject, create_backend, register_backend
+
+# short-lived poll workers (cron, Lambda) pay this on every run
+IMPORT_BUDGET_SECONDS = 0.5
+
+IMPORT_SYNC = """
+import sys, time
+start = time.perf_counter()
+import sync
+print(time.perf_counter() - start)
+print(sorted(m for m in ("boto3", "botocore", "asyncio") if m in sys.modules))
+"""
+
+
+@pytest.mark.startup
+def test_import_sync_under_budget():
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SYNC],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds, heavy_modules = result.stdout.splitlines()
+
+    assert heavy_modules == "[]"
+    assert float(seconds) < IMPORT_BUDGET_SECONDS
+
+
+@pytest.mark.startup
+def test_create_backend(monkeypatch):
+    monkeypatch.setattr(db, "BACKENDS", dict(db.BACKENDS))
+    assert isinstance(create_backend("object"), DBObject)
+
+    register_backend("object_alias", "db:DBObject")
+    assert isinstance(create_backend("object_alias"), DBObject)
+
+
+@pytest.mark.startup
+def test_create_unknown_backend():
+    with pytest.raises(ValueError):
+        create_backend("unknown")
@@ -1,6 +1,31 @@
+import os
+import sys
+
 import dateutil.parser as dt
 
 
 def parse_timestr(timestr):
     """returns milliseconds timestamp given datetime str"""
     return int(dt.parse(timestr).timestamp()) * 1000
+
+
+def current_rss_mb():
+    """returns resident set size of this process in MB, falls back to peak RSS off Linux"""
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """returns peak resident set size of this process in MB, 0 where unsupported (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10